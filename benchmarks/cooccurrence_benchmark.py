@@ -0,0 +1,47 @@
+#Benchmark the co-occurrence engines of openensembles.cooccurrence.coMat
+#
+# To use, run
+#
+# python cooccurrence_benchmark.py
+#
+# from your terminal. This compares the original pairwise loop ('loop') with the sparse indicator product
+# ('indicator') for a range of object numbers (N) and ensemble sizes (H), and checks that both produce the
+# same co-occurrence matrix. Pass --quick for a smaller grid.
+import sys
+import time
+import numpy as np
+import pandas as pd
+import openensembles as oe
+import openensembles.cooccurrence as co
+
+N_LIST = [250, 500, 1000, 2000]
+H_LIST = [10, 50, 200]
+K = 8
+
+if '--quick' in sys.argv:
+    N_LIST = [100, 250]
+    H_LIST = [5, 20]
+
+def make_ensemble(N, H, K, seed=0):
+    """ Build a cluster object holding H random solutions with K clusters over N objects """
+    rng = np.random.RandomState(seed)
+    df = pd.DataFrame(rng.randn(N, 2))
+    dataObj = oe.data(df, [0, 1])
+    c = oe.cluster(dataObj)
+    for h in range(H):
+        c.labels['random_%d'%(h)] = rng.randint(0, K, size=N)
+    return c
+
+def time_engine(c, engine):
+    start = time.time()
+    coMat = co.coMat(c, 'parent', engine=engine)
+    return time.time() - start, coMat
+
+print("%8s %6s %12s %14s %10s %8s"%('N', 'H', 'loop (s)', 'indicator (s)', 'speedup', 'equal'))
+for N in N_LIST:
+    for H in H_LIST:
+        c = make_ensemble(N, H, K)
+        t_loop, coMat_loop = time_engine(c, 'loop')
+        t_ind, coMat_ind = time_engine(c, 'indicator')
+        equal = np.array_equal(coMat_loop.co_matrix.values, coMat_ind.co_matrix.values)
+        print("%8d %6d %12.3f %14.3f %10.1f %8s"%(N, H, t_loop, t_ind, t_loop/max(t_ind, 1e-9), equal))
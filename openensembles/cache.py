@@ -0,0 +1,142 @@
+"""
+OpenEnsembles is a resource for performing and analyzing ensemble clustering
+
+Copyright (C) 2017 Naegle Lab
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from collections import OrderedDict
+import hashlib
+import threading
+import numpy as np
+
+class memory_cache:
+    """
+    A least-recently-used cache of objects whose total size is capped in bytes. When an entry is added or read and the 
+    cache has grown beyond max_bytes, the least recently used entries are evicted until it fits again.
+
+    Parameters
+    ----------
+    max_bytes: int
+        The largest total size, in bytes, of the cached entries. An entry larger than max_bytes is not kept.
+        If None, the cache is unbounded. Default 2**30 (1GB)
+
+    Attributes
+    ----------
+    entries: OrderedDict
+        The cached (value, nbytes) pairs by key, from least to most recently used. nbytes is the size of value, or a 
+        function that returns its current size
+    nbytes: int
+        The current total size of the cached entries
+
+    Notes
+    -----
+    The cache can be shared by threads. It is pickled empty, so that saving an object that holds a cache does not 
+    save the cached entries.
+
+    """
+    def __init__(self, max_bytes=2**30):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+
+    def __getstate__(self):
+        return {'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_bytes'])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    @property
+    def nbytes(self):
+        with self.lock:
+            return sum(size() if callable(size) else size for value, size in self.entries.values())
+
+    def get(self, key):
+        """
+        Return the entry stored under key and mark it as the most recently used, or None if there is no entry
+        """
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            value = self.entries[key][0]
+            self.evict()
+            return value
+
+    def put(self, key, value, nbytes):
+        """
+        Store value under key and evict the least recently used entries beyond max_bytes
+
+        Parameters
+        ----------
+        key: hashable
+            The key of the entry
+        value: object
+            The object to cache
+        nbytes: int or function
+            The size of value in bytes, or a function of no arguments that returns its current size, for a value that 
+            grows after it is cached
+        """
+        with self.lock:
+            self.remove(key)
+            self.entries[key] = (value, nbytes)
+            self.evict()
+
+    def evict(self):
+        """ Remove the least recently used entries, measured at their current size, until the cache fits in max_bytes """
+        if self.max_bytes is None:
+            return
+        with self.lock:
+            while self.entries and self.nbytes > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        """ Remove the entry stored under key, if there is one """
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        """ Remove all entries """
+        with self.lock:
+            self.entries.clear()
+
+def labels_key(labels):
+    """
+    A key that identifies a set of clustering solutions by their names and label contents, so that it changes when
+    a solution is added, removed, renamed or relabeled, but not when the order of the solutions changes
+
+    Parameters
+    ----------
+    labels: dict of lists
+        Clustering solutions by name, as in cluster.labels
+
+    Returns
+    -------
+    key: frozenset
+        Pairs of (name, digest of the labels)
+    """
+    key = []
+    for name in labels:
+        solution = np.ascontiguousarray(labels[name])
+        digest = hashlib.sha1(solution.tobytes())
+        digest.update(str(solution.dtype).encode())
+        key.append((name, digest.hexdigest()))
+    return frozenset(key)
@@ -35,6 +35,7 @@ from types import FunctionType
 import re
 import warnings
 from sklearn import mixture
+import openensembles.cache as cache
 
 class clustering_algorithms:
     """
@@ -55,6 +56,11 @@ class clustering_algorithms:
         Use 'affinity' and 'precomputed' to exert greater control over usage. 
     K: int
         Number of clusters to create, required for most, but not all algorithms. Default K=2
+    distance_cache: openensembles.cache.memory_cache
+        Cache of distance matrices to look up and add the distance matrices of data in, such as the cache of the data 
+        object (openensembles.data.distance_cache). Default None, which calculates every distance matrix
+    source_name: string
+        Name of data in the data object, to key its distance matrices by in distance_cache. Default None
 
     Attributes
     ----------
@@ -65,11 +71,13 @@ class clustering_algorithms:
     --------
     openensembles.cluster()
     """
-    def __init__(self, data, kwargs, K=2):
+    def __init__(self, data, kwargs, K=2, distance_cache=None, source_name=None):
         self.data = data
         self.out = []
         self.var_params = kwargs
         self.K = K
+        self.distance_cache = distance_cache
+        self.source_name = source_name
         #args should have K, even if a default value (should it? not all algorithms need this, use default)
         #if 'K' not in self.args:
         #    raise ValueError('clustering_algorithms should have an instantiated K as part of kwargs key, pair')
@@ -127,7 +135,7 @@ class clustering_algorithms:
         #for anything in self.var_params that may replace defaults, update the param list
         params = returnParams(self.var_params, params, 'kmeans')
 
-        seed = params['random_state'][1][0]
+        seed = algorithm_seed(params['random_state'])
         solution=skc.KMeans(n_clusters=self.K, init=params['init'], 
             n_init=params['n_init'], max_iter=params['max_iter'], tol=params['tol'],
             precompute_distances=params['precompute_distances'], verbose=params['verbose'],
@@ -177,7 +185,7 @@ class clustering_algorithms:
         #for anything in self.var_params that may replace defaults, update the param list
         params = returnParams(self.var_params, params, 'spectral')
  
-        seed = params['random_state'][1][0]
+        seed = algorithm_seed(params['random_state'])
 
         # handle the cases of affinity set, affinity as precomputed with a matrix, distance as a string that needs to be converted and distance as precomputed, which shoudl fail
 
@@ -202,7 +210,7 @@ class clustering_algorithms:
                 raise ValueError("If precomputing a matrix for Spectral clustering, it must be a similarity matrix")
 
             params['affinity'] = 'precomputed'
-            D = returnDistanceMatrix(self.data, self.var_params['distance'])
+            D = returnDistanceMatrix(self.data, self.var_params['distance'], self.distance_cache, self.source_name)
             S = convertDistanceToSimilarity(D)
             solution = skc.SpectralClustering(n_clusters=self.K, n_neighbors=params['n_neighbors'], gamma=params['gamma'],
                         eigen_solver=params['eigen_solver'], random_state=seed, n_init=params['n_init'],
@@ -293,9 +301,9 @@ class clustering_algorithms:
             if self.var_params['distance'] == 'precomputed':
                 d = self.var_params['M']
             else:
-                d = returnDistanceMatrix(self.data, params['distance'])        
+                d = returnDistanceMatrix(self.data, params['distance'], self.distance_cache, self.source_name)
         else:
-            d = returnDistanceMatrix(self.data, params['distance'])        
+            d = returnDistanceMatrix(self.data, params['distance'], self.distance_cache, self.source_name)
 
         solution = skc.DBSCAN(eps=params['eps'], min_samples=params['min_samples'], metric=params['metric'], 
             algorithm=params['algorithm'], leaf_size=params['leaf_size'], 
@@ -334,7 +342,9 @@ class clustering_algorithms:
 
         #params['distance'] says what to precompute on
         params['affinity'] = 'precomputed'
-        d = returnDistanceMatrix(self.data, params['distance'])
+        d = returnDistanceMatrix(self.data, params['distance'], self.distance_cache, self.source_name)
+        if not params['copy']: #a cached distance matrix is read-only, and is not to be overwritten
+            d = np.array(d)
         
         solution = skc.AffinityPropagation(damping=params['damping'], max_iter=params['max_iter'], convergence_iter=params['convergence_iter'], 
             copy=params['copy'], preference=params['preference'], affinity=params['affinity'], verbose=params['verbose'])
@@ -370,7 +380,9 @@ class clustering_algorithms:
             raise ValueError('Birch clustering requires an argument K=<intiger value>')
 
         params = returnParams(self.var_params, params, 'Birch')
-        d = returnDistanceMatrix(self.data, params['distance'])
+        d = returnDistanceMatrix(self.data, params['distance'], self.distance_cache, self.source_name)
+        if not params['copy']: #a cached distance matrix is read-only, and is not to be overwritten
+            d = np.array(d)
 
         solution = skc.Birch(threshold=params['threshold'], branching_factor=params['branching_factor'], n_clusters=params['n_clusters'],
             compute_labels=params['compute_labels'], copy=params['copy'])
@@ -456,7 +468,7 @@ class clustering_algorithms:
 
         params = returnParams(self.var_params, params, 'GaussianMixture')
 
-        seed = params['random_state'][1][0]
+        seed = algorithm_seed(params['random_state'])
 
 
         solution=mixture.GaussianMixture(n_components=params['n_components'], covariance_type=params['covariance_type'], 
@@ -517,7 +529,7 @@ def returnParams(paramsSent, paramsExpected, algorithm):
 
     return params
 
-def returnDistanceMatrix(data, distance):
+def returnDistanceMatrix(data, distance, distance_cache=None, source_name=None):
     """
     A utility to calculate a distance matrix, according to type in <distance> on the data array. 
 
@@ -527,11 +539,16 @@ def returnDistanceMatrix(data, distance):
         Data matrix to calculate distances from
     distance: string
         Distance metric. See `sklearn's pairwise distances <http://scikit-learn.org/stable/modules/generated/sklearn.metrics.pairwise.pairwise_distances.html>`_
+    distance_cache: openensembles.cache.memory_cache
+        If given, the distance matrix is looked up under (source_name, distance), and added after it is calculated. 
+        An entry is only used for the same data array it was calculated from. Default None
+    source_name: string
+        Name of the data array, the first part of the key in distance_cache. Default None
 
     Returns
     -------
     d: matrix 
-        the distance matrix computed by distance
+        the distance matrix computed by distance. A matrix from distance_cache is read-only
 
     Raises
     ------
@@ -543,8 +560,17 @@ def returnDistanceMatrix(data, distance):
     #    raise ValueError("ERROR: the distance you requested, %s, is not available. Please see sklearn.metrics.pairwise.distance_metrics()"%(distance))
     
     #d = distDict[distance](data)
+    if distance_cache is not None:
+        key = (source_name, distance)
+        entry = distance_cache.get(key)
+        if entry is not None and entry[0] is data:
+            return entry[1]
+
     d = sk.metrics.pairwise.pairwise_distances(data, metric=distance)
 
+    if distance_cache is not None:
+        d.setflags(write=False)
+        distance_cache.put(key, (data, d), d.nbytes)
     return d
 
 def convertDistanceToSimilarity(D, beta=1.0):
@@ -566,3 +592,90 @@ def convertDistanceToSimilarity(D, beta=1.0):
     S = np.exp(-beta*D/D.std())
     return S
 
+
+def run_algorithm(data, algorithm, var_params, K, distance_cache=None, source_name=None):
+    """
+    Run one clustering algorithm. This is the clustering step shared by openensembles.cluster.cluster() and the jobs 
+    of openensembles.cluster.cluster_batch(). The stochastic algorithms seed themselves from var_params['random_state'],
+    numpy's global random state is not used, so that jobs can run in concurrent threads
+
+    Parameters
+    ----------
+    data: matrix
+        Data matrix, objects in rows
+    algorithm: string
+        Name of a method of clustering_algorithms
+    var_params: dict
+        Variable parameters of the algorithm, with the 'random_state' of the clustering
+    K: int
+        Number of clusters to create
+    distance_cache: openensembles.cache.memory_cache
+        Cache of the distance matrices of the data sources. Default None
+    source_name: string
+        Name of data, to key its distance matrices by. Default None
+
+    Returns
+    -------
+    out: list of ints
+        The cluster assignments of the objects
+    var_params: dict
+        The final parameters used
+    """
+    c = clustering_algorithms(data, var_params, K, distance_cache=distance_cache, source_name=source_name)
+    func = getattr(c, algorithm)
+    func()
+    return c.out, c.var_params
+
+def random_generator(seed):
+    """
+    Regenerate the random generator of a clustering from its stored seed (see openensembles.cluster.random_state)
+
+    Parameters
+    ----------
+    seed: int, numpy.random.SeedSequence or tuple
+        An int seeds numpy's legacy RandomState, a SeedSequence (entropy and spawn key) seeds MT19937, and a full state
+        tuple (numpy.random.get_state()) is restored as it is
+
+    Returns
+    -------
+    generator: numpy.random.RandomState
+        A new generator, independent of numpy's global random state, or None if seed is None
+    """
+    if seed is None:
+        return None
+    if isinstance(seed, (tuple, dict)):
+        generator = np.random.RandomState()
+        generator.set_state(seed)
+        return generator
+    if isinstance(seed, np.random.SeedSequence):
+        return np.random.RandomState(np.random.MT19937(seed))
+    return np.random.RandomState(seed)
+
+def algorithm_seed(seed):
+    """
+    The int the stochastic algorithms pass to sklearn as random_state, the first key word of the state of the 
+    generator regenerated from seed (None if seed is None). This is the seed of earlier releases, which read it 
+    from the full state stored in params['random_state'][1][0]
+    """
+    if seed is None:
+        return None
+    if isinstance(seed, tuple):
+        return seed[1][0]
+    return random_generator(seed).get_state()[1][0]
+
+#the data sources of a process pool worker, set once by init_worker
+worker_state = {}
+
+def init_worker(D, distance_cache_bytes=None):
+    """ 
+    Keep the data sources (dataObj.D) in the worker, so that they are not sent with every job, and a cache of their 
+    distance matrices for the jobs of the worker, capped at distance_cache_bytes
+    """
+    worker_state['D'] = D
+    worker_state['distance_cache'] = cache.memory_cache(max_bytes=distance_cache_bytes)
+
+def run_job(job):
+    """ Run a job (source_name, algorithm, var_params, K) of cluster_batch() on the data of the worker """
+    source_name, algorithm, var_params, K = job
+    return run_algorithm(worker_state['D'][source_name], algorithm, var_params, K, 
+        distance_cache=worker_state['distance_cache'], source_name=source_name)
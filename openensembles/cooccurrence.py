@@ -18,11 +18,15 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.sharedctypes import RawArray
 import matplotlib.pyplot as plt
 import numpy as np
 import pylab
 import pandas as pd
 import scipy.cluster.hierarchy as sch
+import scipy.sparse as sps
 from scipy.spatial import distance as ssd
 
 class coMat:
@@ -35,6 +39,25 @@ class coMat:
         The clustering object and all contained solutions of interest
     data_source_name: string
         The name of the data source of interest 
+    engine: string {'indicator', 'loop'}
+        How the co-occurrence is accumulated. 'indicator' (default) stacks all solutions into a sparse one-hot 
+        indicator matrix B and calculates B*B' in one pass. 'loop' is the original pairwise loop over every cluster of 
+        every solution. Both produce the same co_matrix.
+    sparse: bool
+        If True, co_matrix is stored as a scipy.sparse.csr_matrix holding only the non-zero co-occurrences, which 
+        requires the 'indicator' engine. Use this for large ensembles where most pairs of objects never co-cluster. Default False
+    counts: matrix or scipy.sparse matrix
+        Co-clustering counts of all solutions in cObj, if already known (see co_occurrence_counts and update_counts). The 
+        ensemble is then not gathered again. Default None
+    memmap_file: string
+        If given, co_matrix is a tiled_matrix that stores co-clustering counts as square tiles in a memory-mapped file at 
+        this path on local disk, for ensembles whose co-occurrence does not fit in memory. Default None
+    tile_size: int
+        Width of the square tiles of a memory-mapped co-occurrence matrix. Default 2048
+    n_jobs: int
+        Number of processes that count the co-occurrence of row blocks (or rows of tiles) of the matrix in parallel 
+        with the indicator engine. Dense counts are written into a shared-memory array and tiles straight into the 
+        memory-mapped file. The counts are exactly those of the serial build. -1 uses all cores. Default 1
 
     Atrributes
     ----------
@@ -44,8 +67,16 @@ class coMat:
         Number of objects
     nEnsembles: int
         Number of clustering solutions
-    co_matrix: pandas dataframe
+    counts: matrix of unsigned ints, scipy.sparse.csr_matrix or tiled_matrix
+        The number of solutions in which each pair of objects co-clusters, in the smallest unsigned integer type that 
+        holds nEnsembles (see count_dtype)
+    co_matrix: pandas dataframe or scipy.sparse.csr_matrix
         The co-occurrence matrix (square). An entry indicates the fraction of times any pair of objects co-clusters across the ensemble
+        This is a csr_matrix without object names when sparse=True and a tiled_matrix when memmap_file is set. 
+        co_matrix is calculated from counts when first accessed and kept until counts is replaced. It cannot be 
+        assigned. See fractions() for a single precision matrix that is not kept
+    header: array
+        The object names (index of the dataObj dataframe)
     avg_dist: float
         The mean of all co-occurrences (not including self distances)
 
@@ -56,9 +87,21 @@ class coMat:
 
     """
 
-    def __init__(self, cObj, data_source_name):
+    def __init__(self, cObj, data_source_name, engine='indicator', sparse=False, counts=None, memmap_file=None, tile_size=2048, n_jobs=1):
+        if engine not in ['indicator', 'loop']:
+            raise ValueError("ERROR: co-occurrence engine %s not recognized, use one of indicator/loop"%(engine))
+        if (sparse or memmap_file) and engine != 'indicator':
+            raise ValueError("ERROR: a sparse or memory-mapped co-occurrence matrix requires the indicator engine")
+        if sparse and memmap_file:
+            raise ValueError("ERROR: a co-occurrence matrix cannot be both sparse and memory-mapped")
         self.cObj = cObj
         self.data_source_name = data_source_name
+        self.engine = engine
+        self.sparse = sparse
+        self.memmap_file = memmap_file
+        self.tile_size = tile_size
+        self.n_jobs = n_jobs
+        self.header = cObj.dataObj.df.index.get_values()
         parg = []
         for solution in cObj.labels:
             parg.append(cObj.labels[solution])
@@ -66,9 +109,76 @@ class coMat:
         self.data = cObj.dataObj.D[data_source_name]
         self.N = self.data.shape[0]
         self.nEnsembles = len(self.parg)
-        co_matrix = self.gather_partitions()
-        self.co_matrix = co_matrix
-        self.avg_dist = np.mean(ssd.squareform(1-self.co_matrix))
+        self.co_matrix_counts = None
+        self.co_matrix_values = None
+        self.counts = counts
+        self.counts = self.gather_partitions()
+
+        #average the off-diagonal co-occurrence from the integer counts, without a matrix of fractions
+        if self.memmap_file:
+            upper_sum = self.counts.upper_sum()
+        else:
+            upper_sum = (self.counts.sum(dtype=np.int64) - self.counts.diagonal().sum(dtype=np.int64))/2
+        self.avg_dist = 1 - upper_sum/(self.nEnsembles*self.N*(self.N-1)/2.)
+
+    @property
+    def co_matrix(self):
+        """
+        The co-occurrence matrix of fractions, calculated from counts on first access and kept until counts is replaced. 
+        This is a dataframe of floats, a csr_matrix of floats if sparse, or the tiled_matrix of counts if memory-mapped 
+        (which converts each tile as it is read)
+        """
+        if self.memmap_file:
+            return self.counts
+        if self.co_matrix_counts is not self.counts:
+            if self.sparse:
+                co_matrix = self.counts.astype(float)
+                co_matrix.data = co_matrix.data/self.nEnsembles #divide stored entries exactly as the dense matrix is
+            else:
+                co_matrix = pd.DataFrame(index=self.header, data=self.counts/float(self.nEnsembles), columns=self.header)
+            self.co_matrix_values = co_matrix
+            self.co_matrix_counts = self.counts
+        return self.co_matrix_values
+
+    @co_matrix.setter
+    def co_matrix(self, value):
+        raise ValueError("ERROR: co_matrix is calculated from counts and cannot be assigned, set counts instead")
+
+    @property
+    def nbytes(self):
+        """
+        The memory held by the co-clustering counts in bytes, and by co_matrix once it is kept. The tiles of a 
+        memory-mapped matrix are on disk and not counted
+        """
+        if self.memmap_file:
+            return 0
+        nbytes = matrix_nbytes(self.counts)
+        if self.co_matrix_counts is self.counts:
+            nbytes += matrix_nbytes(self.co_matrix_values)
+        return nbytes
+
+    def fractions(self, dtype=np.float32):
+        """
+        Convert the co-clustering counts to co-occurrence fractions on demand, by default in single precision
+
+        Parameters
+        ----------
+        dtype: numpy float type
+            The float type of the fractions. Default numpy.float32
+
+        Returns
+        -------
+        fractions: matrix of floats or scipy.sparse.csr_matrix
+            The co-occurrence matrix, without object names
+        """
+        if self.memmap_file:
+            return self.counts.toarray().astype(dtype)
+        fractions = self.counts.astype(dtype)
+        if self.sparse:
+            fractions.data /= self.nEnsembles
+        else:
+            fractions /= self.nEnsembles
+        return fractions
 
     def gather_partitions(self):
         """
@@ -77,22 +187,98 @@ class coMat:
 
         Returns
         -------
-        co_matrix_df: pandas dataframe
-            a dataframe of object names in column and header, wrapped around the co-occurrence matrix
+        counts: matrix of unsigned ints
+            a square matrix of co-clustering counts in the type given by count_dtype(nEnsembles). If self.sparse, 
+            a csr_matrix of the non-zero counts and if self.memmap_file, a tiled_matrix of counts
 
         todo:: Check that the solution dimensionality and the data matrix dimensions are the same
 
         """
         dim = self.N
-        co_matrix = np.zeros(shape=(dim,dim))
-        for solution in self.parg:
-            co_bin = self.gather_single_partition(solution)
-            co_matrix += co_bin
-        co_matrixF = co_matrix/self.nEnsembles
-        header = self.cObj.dataObj.df.index.get_values()
-        co_matrix_df = pd.DataFrame(index=header, data=co_matrixF,
-                columns=header)
-        return co_matrix_df
+        dtype = count_dtype(self.nEnsembles)
+        if self.memmap_file:
+            co_matrix = tiled_matrix(self.memmap_file, self.N, self.nEnsembles, tile_size=self.tile_size)
+            co_matrix.accumulate(self.parg, counts=self.counts, n_jobs=self.n_jobs)
+            return co_matrix
+        if self.sparse:
+            if self.counts is None and num_jobs(self.n_jobs) > 1:
+                co_matrix = sps.vstack(self.gather_parallel(), format='csr')
+            elif self.counts is None:
+                co_matrix = co_occurrence_counts(self.parg, self.N)
+            else:
+                co_matrix = sps.csr_matrix(self.counts, dtype=dtype)
+            co_matrix.sort_indices()
+            return co_matrix.astype(dtype)
+        if sps.issparse(self.counts):
+            co_matrix = self.counts.astype(dtype).toarray()
+        elif self.counts is not None:
+            co_matrix = self.counts.astype(dtype)
+        elif self.engine == 'indicator' and num_jobs(self.n_jobs) > 1:
+            co_matrix = self.gather_parallel()
+        elif self.engine == 'indicator':
+            co_matrix = self.gather_indicator_product()
+        else:
+            co_matrix = np.zeros(shape=(dim,dim), dtype=dtype)
+            for solution in self.parg:
+                co_bin = self.gather_single_partition(solution)
+                co_matrix += co_bin.astype(dtype)
+        return co_matrix
+
+    def gather_indicator_product(self, block_size=2048):
+        """
+        Count co-occurrences of all solutions at once. The ensemble is stacked as a sparse one-hot indicator matrix B 
+        (objects x clusters of all solutions), so that the entry (i,j) of B*B' is the number of solutions in which 
+        objects i and j share a cluster. The product is taken in row blocks to bound the size of the sparse intermediate.
+
+        Parameters
+        ----------
+        block_size: int
+            Number of rows of the product calculated at a time. Default 2048
+
+        Returns
+        -------
+        co_matrix: matrix
+            a square matrix of co-clustering counts (unsigned ints, see count_dtype), equal to the sum of gather_single_partition 
+            across the ensemble
+
+        """
+        B = indicator_matrix(self.parg, self.N)
+        BT = B.T.tocsc()
+        co_matrix = np.zeros(shape=(self.N, self.N), dtype=count_dtype(self.nEnsembles))
+        for start in range(0, self.N, block_size):
+            stop = min(start+block_size, self.N)
+            co_matrix[start:stop,:] = B[start:stop,:].dot(BT).toarray()
+        return co_matrix
+
+    def gather_parallel(self, block_size=2048):
+        """
+        Count co-occurrences as in gather_indicator_product, with the row blocks of the product split across n_jobs 
+        processes. Each worker writes its rows of counts into a shared-memory array, so the blocks are neither 
+        returned through the pool nor summed, and the counts are exactly those of the serial product.
+
+        Parameters
+        ----------
+        block_size: int
+            Number of rows of the product calculated by a worker at a time. Default 2048
+
+        Returns
+        -------
+        co_matrix: matrix or list of scipy.sparse.csr_matrix
+            a square matrix of co-clustering counts (unsigned ints, see count_dtype). If self.sparse, the sparse row 
+            blocks of counts in order
+        """
+        B = indicator_matrix(self.parg, self.N)
+        dtype = count_dtype(self.nEnsembles)
+        blocks = [(start, min(start+block_size, self.N)) for start in range(0, self.N, block_size)]
+        shared = None
+        if not self.sparse:
+            shared = RawArray(np.ctypeslib.as_ctypes_type(dtype), max(1, self.N*self.N))
+        with ProcessPoolExecutor(max_workers=min(num_jobs(self.n_jobs), len(blocks)) or 1, initializer=init_worker, 
+                initargs=(B, shared, (self.N, self.N), dtype)) as pool:
+            results = list(pool.map(count_row_block, blocks))
+        if self.sparse:
+            return results
+        return np.array(np.frombuffer(shared, dtype=dtype)[:self.N*self.N].reshape(self.N, self.N))
 
     def gather_single_partition(self, solution):
         """
@@ -124,34 +310,93 @@ class coMat:
                     co_matrix[y,x]+=1
         return co_matrix
     
-    def pairwise_list(self):
+    def pairwise_list(self, threshold=None, top_k=None, block_size=2048):
         """
-        Reshapes the co-occurrence dataframe matrix into a list, so it can easily be ordered and explored
-        
+        Reshapes the co-occurrence matrix into a list of object pairs, so it can easily be ordered and explored. 
+        The upper triangle of the matrix is read in blocks of rows (or tiles, for a memory-mapped matrix), so that
+        a threshold or top_k query never holds more than a block of pairs beyond the pairs it returns.
+
+        Parameters
+        ----------
+        threshold: float
+            If given, only list pairs that co-occur in at least this fraction of the ensemble. Default None
+        top_k: int
+            If given, only list the top_k pairs that co-occur most often, in order of decreasing co-occurrence and 
+            ties broken by the order of the objects. Default None
+        block_size: int
+            Number of rows of the co-occurrence matrix to read at a time. Default 2048
+
         Returns
         -------
         df: pandas dataframe 
-            with a row entry index of object1_object2 and a co-occurrence column labled 'pairwise'
-
-        """
-        #return a new dataframe in list with index equal to the pairs being
-        #considered 
-        coMat = self.co_matrix
-        df = pd.DataFrame(columns=['site_1', 'site_2', 'pairwise'])
-        headerList = list(coMat)
-
-        for i in range(0, len(headerList)-1):
-            for x in range(i+1, len(headerList)):
-                s = pd.Series()
-                h = headerList[i]
-                j = headerList[x]
-                s['pairwise'] = coMat.loc[h,j]
-                s['site_1'] = h
-                s['site_2'] = j
-                s.name = '%s; %s'%(h,j)
-                df = df.append(s)
+            with a row entry index of object1_object2 and a co-occurrence column labled 'pairwise'. For a sparse 
+            co-occurrence matrix, only pairs that co-cluster at least once are listed.
+
+        Raises
+        ------
+        ValueError:
+            If top_k is negative
+
+        """
+        if top_k is not None and top_k < 0:
+            raise ValueError("ERROR: top_k must be non-negative, got %s"%(top_k))
+        n = float(self.nEnsembles)
+        rows, cols, values = [], [], []
+        for i, j, counts in self.iter_upper_pairs(block_size):
+            x = counts/n
+            if threshold is not None:
+                keep = x >= threshold
+                i, j, x = i[keep], j[keep], x[keep]
+            rows.append(i)
+            cols.append(j)
+            values.append(x)
+            if top_k is not None:
+                i, j, x = [np.concatenate(a) for a in (rows, cols, values)]
+                order = np.lexsort((j, i, -x))[:top_k]
+                rows, cols, values = [i[order]], [j[order]], [x[order]]
+        i, j, x = [np.concatenate(a) if a else np.zeros(0, dtype=int) for a in (rows, cols, values)]
+        if top_k is None:
+            order = np.lexsort((j, i))
+        else:
+            order = np.lexsort((j, i, -x))
+        site_1 = self.header[i[order]]
+        site_2 = self.header[j[order]]
+        index = ['%s; %s'%(h,k) for h, k in zip(site_1, site_2)]
+        df = pd.DataFrame({'site_1':site_1, 'site_2':site_2, 'pairwise':x[order].astype(float)}, index=index, 
+            columns=['site_1', 'site_2', 'pairwise'])
         return df
 
+    def iter_upper_pairs(self, block_size=2048):
+        """
+        Iterate over the pairs of objects (i,j), i<j, of the upper triangle of the co-clustering counts, one block 
+        at a time. Sparse matrices only yield the pairs that co-cluster at least once.
+
+        Parameters
+        ----------
+        block_size: int
+            Number of rows of the matrix to read at a time. Default 2048
+
+        Returns
+        -------
+        generator of (i, j, counts)
+            Arrays of the row and column of each pair and the number of solutions in which the pair co-clusters
+        """
+        if self.memmap_file:
+            for rStart, cStart, counts in self.counts.iter_tiles():
+                i, j = np.nonzero(np.triu(np.ones(counts.shape, dtype=bool), k=rStart-cStart+1))
+                yield i + rStart, j + cStart, counts[i, j]
+        elif self.sparse:
+            upper = sps.triu(self.counts, k=1).tocsr()
+            upper.sort_indices()
+            for start in range(0, self.N, block_size):
+                block = upper[start:start+block_size].tocoo()
+                yield block.row + start, block.col, block.data
+        else:
+            for start in range(0, self.N, block_size):
+                counts = self.counts[start:start+block_size]
+                i, j = np.nonzero(np.triu(np.ones(counts.shape, dtype=bool), k=start+1))
+                yield i + start, j, counts[i, j]
+
     def link(self, linkage='average'):
         """
         Link a co-occurrence matrix. This is required so that co-occurrence is properly treated as a distance matrix
@@ -165,13 +410,39 @@ class coMat:
         Returns
         -------
         lnk: scipy.cluster.hierarch.linkage object
+
+        Notes
+        -----
+        scipy's linkage operates on the condensed distance vector (N*(N-1)/2 entries). For a sparse co-occurrence 
+        matrix this vector is filled directly from the stored entries, so the square matrix is never made dense. For a 
+        memory-mapped co-occurrence matrix it is filled tile by tile into a second memory-mapped file; scipy still holds 
+        a copy of it in memory for every linkage except 'single'.
         """
-        #arr = self.co_matrix
-        #set diagonal to zero
-        arr = 1 - self.co_matrix
-        lnk = sch.linkage(ssd.squareform(arr), method=linkage, metric='euclidean')
+        lnk = sch.linkage(self.condensed_distance(), method=linkage, metric='euclidean')
         return lnk
 
+    def condensed_distance(self):
+        """
+        The condensed distance vector (as in scipy.spatial.distance.squareform) of 1-co_matrix. 
+
+        Returns
+        -------
+        dist: array of floats
+            Distances of all pairs (i,j), i<j, ordered by i and then j. This is a numpy.memmap at memmap_file+'.condensed'
+            for a memory-mapped co-occurrence matrix
+        """
+        if self.memmap_file:
+            return self.counts.condensed_distance(self.memmap_file + '.condensed')
+        if not self.sparse:
+            return 1 - ssd.squareform(self.counts, checks=False)/float(self.nEnsembles)
+        N = self.N
+        dist = np.ones(N*(N-1)//2)
+        upper = sps.triu(self.counts, k=1).tocoo()
+        i = upper.row.astype(np.int64)
+        j = upper.col.astype(np.int64)
+        dist[N*i - i*(i+1)//2 + (j-i-1)] = 1 - upper.data/float(self.nEnsembles)
+        return dist
+
     def cut(self, lnk, threshold):
         """
         **A finishing technique**
@@ -188,6 +459,65 @@ class coMat:
         ind = sch.fcluster(lnk, threshold, 'distance')
         return ind
 
+    def cut_sweep(self, lnk, thresholds=None, n_clusters=None):
+        """
+        Cut one linkage at many thresholds, or into many numbers of clusters, so that the linkage is calculated once 
+        for a whole model-selection sweep. Give either thresholds or n_clusters.
+
+        Parameters
+        ----------
+        lnk: scipy.cluster.hierarchy.linkage object
+            A linkage, that can be generated by self.link()
+        thresholds: list of floats
+            Distances to cut the linkage at, as in self.cut(). Default None
+        n_clusters: list of ints
+            Largest numbers of clusters to cut into (fcluster criterion 'maxclust'). Default None
+
+        Returns
+        -------
+        labels: matrix of ints
+            One row of labels (1..K) for every threshold or number of clusters, in the order given 
+        K: array of ints
+            The number of clusters of every cut
+        """
+        if (thresholds is None) == (n_clusters is None):
+            raise ValueError("ERROR: give one of thresholds or n_clusters to cut the linkage")
+        if thresholds is not None:
+            values = np.atleast_1d(np.asarray(thresholds, dtype=float))
+            criterion = 'distance'
+        else:
+            values = np.atleast_1d(np.asarray(n_clusters, dtype=int))
+            criterion = 'maxclust'
+        labels = np.empty((len(values), lnk.shape[0]+1), dtype=np.int32)
+        for i, value in enumerate(values):
+            labels[i] = sch.fcluster(lnk, value, criterion)
+        K = labels.max(axis=1) if len(values) else np.zeros(0, dtype=np.int32)
+        return labels, K
+
+    def lifetime_threshold(self, lnk):
+        """
+        The maximal lifetime threshold of a linkage, for evidence accumulation. The lifetime of a number of clusters is 
+        the range of distances over which a cut gives that number, i.e. the gap between consecutive merge heights. The 
+        threshold is the middle of the largest gap, so that the cut gives the most stable number of clusters.
+
+        Parameters
+        ----------
+        lnk: scipy.cluster.hierarchy.linkage object
+            A linkage, that can be generated by self.link()
+
+        Returns
+        -------
+        threshold: float
+            The distance to cut lnk at, e.g. with self.cut(). If lnk has fewer than two merges, this is the height of 
+            the last merge, so that all objects are in one cluster
+        """
+        heights = np.sort(lnk[:,2])
+        if len(heights) < 2:
+            return heights[-1] if len(heights) else 0.
+        gaps = np.diff(heights)
+        largest = np.argmax(gaps)
+        return heights[largest] + gaps[largest]/2.
+
      
     def plot(self, threshold='avg', linkage='average', add_labels= True, **kwargs):#dist_thresh=self.avg_dist):
         """
@@ -201,7 +531,8 @@ class coMat:
         threshold: float
             Use threshold to color the dendrogram
             This is useful for identifying visually how to call .cut()
-            Default is the average value in the co-occurrence matrix, which is updated to float when 'avg' is passed
+            Default is the average value in the co-occurrence matrix, which is updated to float when 'avg' is passed.
+            Pass 'auto' to color at the maximal lifetime threshold (see lifetime_threshold())
         add_labels: bool
             If you wish to shut off printing of labels pass False, else this will print labels according to the co-matrix data frame headers
         linkage: string
@@ -227,23 +558,412 @@ class coMat:
 
 
         """
-        if isinstance(threshold, str):
+        lnk = self.link(linkage=linkage)
+        if threshold == 'auto':
+            threshold = self.lifetime_threshold(lnk)
+        elif isinstance(threshold, str):
             threshold = self.avg_dist
         
         if add_labels:
             if "label_vec" in kwargs: # use this if you have different labels than in c.dataObj.df.index.values
                 label_vec = kwargs['label_vec']
-                if len(label_vec) != len(self.co_matrix):
+                if len(label_vec) != self.N:
                     raise ValueError("ERROR: the length of label vector does not equal the number of objects in the co_occurrence matrix")
             else:
                 label_vec = self.cObj.dataObj.df.index.values.tolist() #using parent just to get column names
         else: 
             label_vec = []
 
-        fig = plot_matrix_sorted(self.co_matrix, label_vec, threshold, self.link(linkage=linkage))
+        matrix = self.co_matrix
+        if self.sparse or self.memmap_file: #the heatmap is drawn in full, so only plot small matrices this way
+            matrix = pd.DataFrame(index=self.header, data=self.co_matrix.toarray(), columns=self.header)
+        fig = plot_matrix_sorted(matrix, label_vec, threshold, lnk)
             
         return fig
 
+class tiled_matrix:
+    """
+    A square, symmetric matrix of co-clustering counts stored as square tiles in a memory-mapped file on disk. Only the 
+    tiles on and above the diagonal are stored, each as a contiguous block, so a tile is read from disk in one piece. 
+    Counts are kept in the smallest unsigned integer type that holds the ensemble size.
+
+    Parameters
+    ----------
+    filename: string
+        Path of the memory-mapped file. It is created (or overwritten)
+    N: int
+        Number of objects
+    nEnsembles: int
+        Number of clustering solutions, used to convert counts to co-occurrence fractions
+    tile_size: int
+        Width of the square tiles. Default 2048
+
+    Attributes
+    ----------
+    shape: tuple
+        (N, N)
+    nTiles: int
+        Number of tiles along each side of the matrix
+    tiles: numpy.memmap
+        The stored tiles, in order (0,0), (0,1) .. (0,nTiles-1), (1,1) ..
+
+    See Also
+    --------
+    openensembles.coMat
+
+    """
+    def __init__(self, filename, N, nEnsembles, tile_size=2048):
+        self.filename = filename
+        self.N = N
+        self.shape = (N, N)
+        self.nEnsembles = nEnsembles
+        self.tile_size = tile_size
+        self.nTiles = max(1, -(-N//tile_size))
+        nStored = self.nTiles*(self.nTiles+1)//2
+        self.tiles = new_memmap(filename, dtype=count_dtype(nEnsembles), shape=(nStored, tile_size, tile_size))
+
+    def __len__(self):
+        return self.N
+
+    def tile_index(self, I, J):
+        """ Position in self.tiles of tile (I,J), I <= J """
+        return I*self.nTiles - I*(I-1)//2 + (J-I)
+
+    def tile_range(self, I):
+        """ The objects (start, stop) covered by row or column of tiles I """
+        start = I*self.tile_size
+        return start, min(start+self.tile_size, self.N)
+
+    def tile(self, I, J):
+        """
+        Read tile (I,J) of co-clustering counts
+
+        Returns
+        -------
+        counts: matrix of ints
+            The counts of objects in tile row I against objects in tile column J, trimmed at the matrix edge
+        """
+        if I > J:
+            return self.tile(J, I).T
+        rStart, rStop = self.tile_range(I)
+        cStart, cStop = self.tile_range(J)
+        return np.array(self.tiles[self.tile_index(I, J), :rStop-rStart, :cStop-cStart])
+
+    def iter_tiles(self):
+        """
+        Iterate over the stored tiles, on and above the diagonal, reading one tile at a time
+
+        Returns
+        -------
+        generator of (rStart, cStart, counts)
+            The first object of the tile's rows and columns and the tile of counts
+        """
+        for I in range(self.nTiles):
+            for J in range(I, self.nTiles):
+                yield self.tile_range(I)[0], self.tile_range(J)[0], self.tile(I, J)
+
+    def accumulate(self, parg, counts=None, n_jobs=1):
+        """
+        Count the co-clustering of all pairs of objects tile by tile and write each tile to disk. Every tile is the 
+        product of two row blocks of the sparse indicator matrix of the ensemble.
+
+        Parameters
+        ----------
+        parg: list of lists of ints
+            Solutions of assignments of objects to clusters
+        counts: matrix or scipy.sparse matrix
+            Known co-clustering counts to write instead of counting parg. Default None
+        n_jobs: int
+            Number of processes that count rows of tiles in parallel, each writing to the file. -1 uses all cores. Default 1
+        """
+        if counts is not None:
+            if sps.issparse(counts):
+                counts = sps.csr_matrix(counts)
+            for I in range(self.nTiles):
+                self.write_tile_row(I, counts=counts)
+        elif num_jobs(n_jobs) > 1 and self.nTiles > 1:
+            self.tiles.flush()
+            with ProcessPoolExecutor(max_workers=min(num_jobs(n_jobs), self.nTiles), initializer=init_worker, 
+                    initargs=(indicator_matrix(parg, self.N), None, None, None, self)) as pool:
+                list(pool.map(count_tile_row, range(self.nTiles)))
+        else:
+            B = indicator_matrix(parg, self.N)
+            for I in range(self.nTiles):
+                self.write_tile_row(I, B=B)
+        self.tiles.flush()
+
+    def write_tile_row(self, I, B=None, counts=None):
+        """
+        Write the tiles (I,J), J >= I, as products of row blocks of the indicator matrix B or as slices of known counts
+        """
+        rStart, rStop = self.tile_range(I)
+        if counts is None:
+            rows = B[rStart:rStop,:]
+        for J in range(I, self.nTiles):
+            cStart, cStop = self.tile_range(J)
+            if counts is None:
+                block = rows.dot(B[cStart:cStop,:].T).toarray()
+            else:
+                block = counts[rStart:rStop, cStart:cStop]
+                if sps.issparse(block):
+                    block = block.toarray()
+            self.tiles[self.tile_index(I, J), :rStop-rStart, :cStop-cStart] = block
+
+    def __getstate__(self):
+        #workers reopen the file rather than receive the tiles
+        state = dict(self.__dict__)
+        del state['tiles']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        nStored = self.nTiles*(self.nTiles+1)//2
+        self.tiles = np.memmap(self.filename, dtype=count_dtype(self.nEnsembles), mode='r+', 
+            shape=(nStored, self.tile_size, self.tile_size))
+
+    def upper_sum(self):
+        """ The sum of all counts above the diagonal, read tile by tile """
+        total = 0
+        for rStart, cStart, counts in self.iter_tiles():
+            if rStart == cStart:
+                counts = np.triu(counts, k=1)
+            total += counts.sum(dtype=np.int64)
+        return total
+
+    def condensed_distance(self, filename):
+        """
+        Write the condensed distance vector of 1 - counts/nEnsembles to a memory-mapped file, tile by tile
+
+        Parameters
+        ----------
+        filename: string
+            Path of the memory-mapped file to write
+
+        Returns
+        -------
+        dist: numpy.memmap of floats
+            Distances of all pairs (i,j), i<j, ordered by i and then j
+        """
+        N = self.N
+        dist = new_memmap(filename, dtype=np.float64, shape=(max(1, N*(N-1)//2),))
+        for rStart, cStart, counts in self.iter_tiles():
+            i, j = np.indices(counts.shape, dtype=np.int64)
+            i = (i + rStart).ravel()
+            j = (j + cStart).ravel()
+            upper = j > i
+            i = i[upper]
+            j = j[upper]
+            dist[N*i - i*(i+1)//2 + (j-i-1)] = 1 - counts.ravel()[upper]/float(self.nEnsembles)
+        dist.flush()
+        return dist[:N*(N-1)//2]
+
+    def toarray(self):
+        """ The full matrix of co-occurrence fractions, in memory """
+        matrix = np.zeros(self.shape)
+        for rStart, cStart, counts in self.iter_tiles():
+            rStop = rStart + counts.shape[0]
+            cStop = cStart + counts.shape[1]
+            matrix[rStart:rStop, cStart:cStop] = counts/float(self.nEnsembles)
+            matrix[cStart:cStop, rStart:rStop] = counts.T/float(self.nEnsembles)
+        return matrix
+
+def num_jobs(n_jobs):
+    """
+    The number of processes to use for n_jobs, where negative values count back from the number of cores (-1 uses all)
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return max(1, n_jobs)
+
+#the state of a worker process of a parallel co-occurrence count, set once per process by init_worker
+worker_state = {}
+
+def init_worker(B, shared, shape, dtype, tiles=None):
+    """
+    Initialize a worker process with the indicator matrix B and the shared-memory counts or tiled_matrix to write to
+    """
+    worker_state['B'] = B
+    worker_state['BT'] = B.T.tocsc()
+    worker_state['tiles'] = tiles
+    worker_state['counts'] = None
+    if shared is not None:
+        worker_state['counts'] = np.frombuffer(shared, dtype=dtype)[:shape[0]*shape[1]].reshape(shape)
+
+def count_row_block(rows):
+    """
+    Count the co-occurrence of the objects in rows (start, stop) with all objects. The counts are written to the 
+    shared-memory array of the worker, or returned as a csr_matrix if there is none
+    """
+    start, stop = rows
+    block = worker_state['B'][start:stop,:].dot(worker_state['BT'])
+    if worker_state['counts'] is None:
+        return block.tocsr()
+    worker_state['counts'][start:stop,:] = block.toarray()
+
+def count_tile_row(I):
+    """
+    Count the co-occurrence of row I of tiles and write it to the memory-mapped file of the worker's tiled_matrix
+    """
+    tiles = worker_state['tiles']
+    tiles.write_tile_row(I, B=worker_state['B'])
+    tiles.tiles.flush()
+
+def new_memmap(filename, dtype, shape):
+    """
+    Create a memory-mapped array in a new file at filename. An existing file is unlinked rather than truncated, so 
+    that arrays still mapped to it keep their contents
+
+    Parameters
+    ----------
+    filename: string
+        Path of the file
+    dtype: numpy dtype
+        Type of the array
+    shape: tuple
+        Shape of the array
+
+    Returns
+    -------
+    array: numpy.memmap
+    """
+    if os.path.exists(filename):
+        os.remove(filename)
+    return np.memmap(filename, dtype=dtype, mode='w+', shape=shape)
+
+def matrix_nbytes(matrix):
+    """
+    The memory held by a matrix, dataframe or scipy.sparse.csr_matrix in bytes
+    """
+    if sps.issparse(matrix):
+        return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+    return np.asarray(matrix).nbytes
+
+def count_dtype(nEnsembles):
+    """
+    The smallest unsigned integer type that can hold co-clustering counts of an ensemble
+
+    Parameters
+    ----------
+    nEnsembles: int
+        Number of clustering solutions
+
+    Returns
+    -------
+    dtype: numpy dtype
+        One of numpy.uint8, numpy.uint16, numpy.uint32 or numpy.uint64
+    """
+    for dtype in [np.uint8, np.uint16, np.uint32]:
+        if nEnsembles <= np.iinfo(dtype).max:
+            return dtype
+    return np.uint64
+
+def indicator_matrix(parg, N):
+    """
+    Stack a list of solutions into a sparse one-hot indicator matrix, with one column per cluster of every solution
+
+    Parameters
+    ----------
+    parg: list of lists of ints
+        Solutions of assignments of objects to clusters across an ensemble
+    N: int
+        Number of objects
+
+    Returns
+    -------
+    B: scipy.sparse.csr_matrix
+        N x (total number of clusters) matrix, with B[i,c]=1 if object i is assigned to cluster c
+
+    Raises
+    ------
+    ValueError:
+        if a solution does not have N labels
+
+    """
+    cols = []
+    offset = 0
+    for solution in parg:
+        if len(solution) != N:
+            raise ValueError("ERROR: solution has %d labels, but there are %d objects"%(len(solution), N))
+        clusterid_list, inverse = np.unique(solution, return_inverse=True)
+        cols.append(inverse.ravel() + offset)
+        offset += len(clusterid_list)
+    if cols:
+        cols = np.concatenate(cols)
+    else:
+        cols = np.zeros(0, dtype=int)
+    rows = np.tile(np.arange(N), len(parg))
+    data = np.ones(len(cols), dtype=np.int32)
+    B = sps.csr_matrix((data, (rows, cols)), shape=(N, offset))
+    return B
+
+def co_occurrence_counts(parg, N):
+    """
+    Count the number of solutions in which every pair of objects is assigned to the same cluster. Counts of 
+    separate sets of solutions can be added and subtracted to update the counts of an ensemble.
+
+    Parameters
+    ----------
+    parg: list of lists of ints
+        Solutions of assignments of objects to clusters
+    N: int
+        Number of objects
+
+    Returns
+    -------
+    counts: scipy.sparse.csr_matrix
+        N x N matrix of ints with sorted indices, zero where a pair never co-clusters
+
+    """
+    B = indicator_matrix(parg, N)
+    counts = B.dot(B.T).tocsr()
+    counts.sort_indices()
+    return counts
+
+def update_counts(counts, parg, N, nEnsembles, subtract=False, block_size=2048):
+    """
+    Add the co-occurrence counts of a set of solutions to dense counts in place, or subtract them. The counts are 
+    kept in the smallest unsigned integer type that holds nEnsembles (see count_dtype), and the product of the 
+    indicator matrix is taken in row blocks, so no N x N matrix of wider ints is made.
+
+    Parameters
+    ----------
+    counts: matrix of unsigned ints
+        N x N co-clustering counts to update, or None to start from zero
+    parg: list of lists of ints
+        Solutions of assignments of objects to clusters
+    N: int
+        Number of objects
+    nEnsembles: int
+        Number of solutions counted once the update is done
+    subtract: bool
+        If True, subtract the counts of parg, which must have been added before. Default False
+    block_size: int
+        Number of rows of the product calculated at a time. Default 2048
+
+    Returns
+    -------
+    counts: matrix of unsigned ints
+        The updated counts, which are a new, wider matrix when nEnsembles outgrows the type of counts
+
+    """
+    dtype = count_dtype(nEnsembles)
+    if counts is None:
+        counts = np.zeros(shape=(N, N), dtype=dtype)
+    elif np.iinfo(counts.dtype).max < nEnsembles:
+        counts = counts.astype(dtype)
+    B = indicator_matrix(parg, N)
+    BT = B.T.tocsc()
+    for start in range(0, N, block_size):
+        stop = min(start+block_size, N)
+        block = B[start:stop,:].dot(BT).toarray().astype(counts.dtype)
+        if subtract:
+            counts[start:stop,:] -= block
+        else:
+            counts[start:stop,:] += block
+    return counts
+
 def plot_matrix_sorted(matrix, label_vec, threshold, lnk1):
     """
     A heatmap plotting function, for both co-occurrence and mutual information
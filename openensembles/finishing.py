@@ -26,7 +26,15 @@ import sklearn.cluster
 import sys
 import os
 import networkx as nx
+import scipy.sparse as sps
+from scipy.sparse import csgraph
+import scipy.cluster.hierarchy as sch
+import scipy.spatial.distance as ssd
+from scipy.special import logsumexp
+from scipy.optimize import linear_sum_assignment
+import openensembles.cooccurrence as co
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 class mixture_model:
 	"""
@@ -45,14 +53,60 @@ class mixture_model:
 		Number of clusters to create in mixture model
 		Default is 2
 	iterations: 
-		Number of expectation maximization iterations
+		Number of expectation maximization iterations, or the most iterations if tol is set
 		Default is 10
+	tol: float
+		If set, stop once an iteration improves the log-likelihood by less than tol. Default None
+	n_init: int
+		Number of random restarts. The restart with the highest log-likelihood is kept. Default 1
+	random_state: int
+		Seed of the random starts. Each restart draws from its own generator, spawned from a numpy.random.SeedSequence
+		of this seed, so that the restarts are reproducible and independent of how they are scheduled. If None and 
+		n_init is 1, the start is drawn from numpy.random as before. Default None
+	n_jobs: int
+		Number of processes that run restarts in parallel. -1 uses all cores. Default 1
+	seed: numpy.random.SeedSequence
+		The seed of a single restart, as spawned for the restarts of a model with n_init > 1. Default None
+	batch_size: int
+		If set, run stochastic mini-batch (stepwise) EM: every iteration is a pass over the objects in shuffled batches 
+		of batch_size, and the parameters are updated after each batch from a running average of the batch statistics, 
+		so that a step touches only batch_size objects. The final posteriors and labels are calculated in a full 
+		pass, also batch by batch. Default None
+	step_decay: float
+		Decay of the step size (t+1)^-step_decay of the t-th mini-batch update, in (0.5, 1]. Default 0.6
 
 
 	Attributes
 	----------
 	labels: list of ints
 		Final Mixture Model partitions of objects
+	ExpZ: matrix of floats
+		The posterior probability of every component of the mixture for every object (N x nEnsCluster)
+	logLikelihood: float
+		The log-likelihood of the ensemble under the model, as of the last expectation step
+	codes: matrix of ints
+		The labels of every object (rows) in every solution (columns), coded as the position of the label in K(j), 
+		or -1 for a missing label (NaN or 'NaN'). Missing labels do not contribute to the likelihood
+	K: list of tuples
+		The clusters K(j) of every solution, in sorted order
+	nClusters: array of ints
+		The number of clusters of every solution
+	V: 3-D array of floats
+		v(j,m,k), the probability of cluster k of solution j under component m, padded to H x nEnsCluster x max K(j)
+	mask: matrix of bools
+		True where cluster k exists in solution j (H x max K(j)). Padded entries of V are 0
+	v: list of lists of arrays
+		The unpadded v(j,m), views of V
+	indicator: scipy.sparse.csr_matrix
+		One-hot labels of the ensemble, one column for every entry (j,k) of V (N x H*max K(j))
+	nIterations: int
+		Number of iterations run by emProcess
+	converged: bool
+		True if emProcess stopped because the log-likelihood improved by less than tol
+	seeds: list of numpy.random.SeedSequence
+		The seed of every restart, None if the start is drawn from numpy.random
+	logLikelihoods: list of floats
+		The final log-likelihood of every restart, if there were restarts
 
 
 	See Also
@@ -66,21 +120,59 @@ class mixture_model:
 
 	"""
 
-	def __init__(self, parg, N, nEnsCluster=2, iterations=10):
+	def __init__(self, parg, N, nEnsCluster=2, iterations=10, tol=None, n_init=1, random_state=None, n_jobs=1, seed=None, 
+			batch_size=None, step_decay=0.6):
+		if batch_size is not None and batch_size <= 0:
+			raise ValueError("ERROR: mini-batch EM needs a positive batch_size, not %s"%(batch_size))
+		if not 0.5 < step_decay <= 1:
+			raise ValueError("ERROR: step_decay %s is outside of (0.5, 1]"%(step_decay))
 		
 		self.parg = parg #list of lists of solutions
 		self.N = N# number of data points
 		self.nEnsCluster = nEnsCluster #number of clusters to make from ensemble
 		self.iterations = iterations
-
-		self.y = self.gatherPartitions()
-		self.y
-		self.K = self.genKj()
-		self.alpha, self.v, self.ExpZ = self.initParameters()
+		self.tol = tol
+		self.n_init = n_init
+		self.n_jobs = n_jobs
+		self.batch_size = batch_size
+		self.step_decay = step_decay
+		self.seeds = None
+		self.random = None #numpy.random
+		if seed is not None: #a single restart
+			self.seeds = [seed]
+		elif random_state is not None or n_init > 1:
+			self.seeds = np.random.SeedSequence(random_state).spawn(n_init)
+		if self.seeds is not None:
+			self.random = np.random.RandomState(np.random.MT19937(self.seeds[0]))
+		self.nIterations = 0
+		self.nSteps = 0
+		self.converged = False
+
+		self.codes, self.K = self.encodePartitions()
+		self.nClusters = np.array([len(clusters) for clusters in self.K], dtype=int)
+		self.maxK = max(1, self.nClusters.max()) if len(self.K) else 1
+		self.mask = np.arange(self.maxK) < self.nClusters[:,None]
+		self.indicator = self.indicatorMatrix()
+		self.alpha, self.V, self.ExpZ = self.initParameters()
+		self.logLikelihood = -np.inf
 		self.labels = []
 		self.piFinishing = {}
 		
 
+	@property
+	def y(self):
+		'''
+		The labels as a dataframe of objects (rows) and partitions (columns), built on demand
+		'''
+		return self.gatherPartitions()
+
+	@property
+	def v(self):
+		'''
+		The ragged v(j,m), as views of the padded V
+		'''
+		return [[self.V[j,m,:self.nClusters[j]] for m in range(self.nEnsCluster)] for j in range(len(self.K))]
+
 	def gatherPartitions(self):
 		'''
 		Returns the y vector.
@@ -98,23 +190,49 @@ class mixture_model:
 		y.index.name = 'objs'
 		y.columns.name = 'partition'
 		return y
-	
+
+	def encodePartitions(self):
+	    '''
+	    Codes the labels of every partition j as integers once, as positions in the sorted clusters K(j) of the 
+	    partition, and -1 for missing labels (NaN or 'NaN').
+	    Returns the N x H matrix of codes and K, the list of tuples of the clusters of every partition
+	    '''
+	    H = len(self.parg)
+	    codes = np.full((self.N, H), -1, dtype=np.int32)
+	    K = []
+	    for j in range(H):
+	        solution = np.asarray(self.parg[j])
+	        if solution.shape[0] != self.N:
+	            raise ValueError("ERROR: solution %d has %d labels, expected %d"%(j, solution.shape[0], self.N))
+	        if solution.dtype.kind == 'f':
+	            present = ~np.isnan(solution)
+	        elif solution.dtype.kind in 'OUS':
+	            present = np.array([not (x == 'NaN' or (isinstance(x, float) and np.isnan(x))) for x in solution], dtype=bool)
+	        else:
+	            present = np.ones(self.N, dtype=bool)
+	        clusters, code = np.unique(solution[present], return_inverse=True)
+	        codes[present, j] = code.ravel()
+	        K.append(tuple(clusters))
+	    return codes, K
+
 	def genKj(self):
 	    '''
 	    Generates the K(j) H-array that contains the tuples of unique 
 	    clusters of each j-th partition, eg: K = [(X,Y), (A,B)] 
 	    '''
-	    #K = np.zeros(y.shape[1], dtype= int)
-	    K = []
-	    aux = []
-	    for i in range(self.y.shape[1]):
-	        if 'NaN' in np.unique(self.y.iloc[:,i].values):
-	            aux = copy.copy(self.y.iloc[:,i].values)
-	            aux = [x for x in aux if x != 'NaN']
-	            K.append(aux)
-	        else:
-	            K.append(tuple(np.unique(self.y.iloc[:,i].values)))
-	    return K
+	    return self.encodePartitions()[1]
+
+	def indicatorMatrix(self, rows=None):
+	    '''
+	    One-hot encodes the coded labels of the objects in rows (all objects if None), with column j*max K(j) + k for 
+	    cluster k of partition j, so that the model is evaluated with sparse products over all objects at once. 
+	    Missing labels have no entry.
+	    '''
+	    codes = self.codes if rows is None else self.codes[rows]
+	    present = codes >= 0
+	    objects, partitions = np.nonzero(present)
+	    columns = partitions*self.maxK + codes[present]
+	    return sps.csr_matrix((np.ones(len(objects)), (objects, columns)), shape=(codes.shape[0], len(self.K)*self.maxK))
 
 	def initParameters(self):
 	    '''
@@ -124,140 +242,168 @@ class mixture_model:
 	        return np.ones(self.nEnsCluster) / self.nEnsCluster
 	        
 	    def initV():
-	        v = []
-	        [v.append([]) for j in range(self.y.shape[1])]
+	        random = np.random if self.random is None else self.random
+	        V = np.zeros((len(self.K), self.nEnsCluster, self.maxK))
 	        
-	        #[v[j].append(list(np.ones(len(self.K[j])) / len(self.K[j]))) for j in range(self.y.shape[1]) for m in range(self.nEnsCluster)]
-	        for j in range(self.y.shape[1]):
+	        #drawn in the same order as the original ragged list of v(j,m)
+	        for j in range(len(self.K)):
 	        	for m in range(self.nEnsCluster):
-	        		aux = abs(np.random.randn(len(self.K[j])))
-	        		v[j].append( aux / sum(aux) )
+	        		aux = abs(random.randn(self.nClusters[j]))
+	        		V[j,m,:self.nClusters[j]] = aux / sum(aux)
 	        
-	        return v
+	        return V
 	    
 	    def initExpZ():
-	        return np.zeros(self.y.shape[0] * self.nEnsCluster).reshape(self.y.shape[0],self.nEnsCluster)
+	        return np.zeros(self.N * self.nEnsCluster).reshape(self.N,self.nEnsCluster)
 	    
 	    alpha = initAlpha()
-	    v = initV()
+	    V = initV()
 	    ExpZ = initExpZ()
-	    return alpha, v, ExpZ
+	    return alpha, V, ExpZ
 
 
 	def expectation(self):
 	    '''
-	    Compute the Expectation (ExpZ) according to parameters.
+	    Compute the Expectation (ExpZ) according to parameters, in log-probabilities so that the product over a large 
+	    ensemble does not underflow. log P(y_i, m) = log alpha(m) + sum_j log v(j,m,y_ij) is one sparse product of the 
+	    one-hot labels with log v, and ExpZ is its softmax over the components m.
 	    Obs: y(N,H) Kj(H) alpha(M) v(H,M,K(j)) ExpZ(N,M)
 	    '''
-	    def sigma(a,b):
-	    	return 1 if a == b else 0
-
-	    M = self.ExpZ.shape[1]
-	    nElem = self.y.shape[0]
-	    
-	    
-	    for m in range(M):
-	        for i in range(nElem):
-	            
-	            prod1 = 1
-	            num = 0
-	            for j in range(self.y.shape[1]):
-	                ix1 = 0
-	                for k in self.K[j]:
-	                    prod1 *= ( self.v[j][m][ix1] ** sigma(self.y.iloc[i][j],k) )
-	                    ix1 += 1
-	            num += self.alpha[m] * prod1
-	            
-	            den = 0
-	            for n in range(M):
-	            
-	                prod2 = 1
-	                for j2 in range(self.y.shape[1]):
-	                    ix2 = 0
-	                    for k in self.K[j2]:
-	                        prod2 *= ( self.v[j2][n][ix2] ** sigma(self.y.iloc[i][j2],k) )
-	                        ix2 += 1
-	                den += self.alpha[n] * prod2
-	            
-	            
-	            self.ExpZ[i][m] = float(num) / float(den)
-	    
+	    if self.batch_size is None:
+	        self.ExpZ, self.logLikelihood = self.expectationRows()
+	        return self.ExpZ
+	    #the posterior of all objects, a batch at a time
+	    self.logLikelihood = 0
+	    for start in range(0, self.N, self.batch_size):
+	        rows = slice(start, start + self.batch_size)
+	        self.ExpZ[rows], logLikelihood = self.expectationRows(rows)
+	        self.logLikelihood += logLikelihood
 	    return self.ExpZ
 
+	def expectationRows(self, rows=None):
+	    '''
+	    The posterior ExpZ of the objects in rows (all objects if None), and their log-likelihood
+	    '''
+	    logP = self.logJoint(self.indicator if rows is None else self.indicator[rows])
+	    logNorm = logsumexp(logP, axis=1)
+	    return self.posterior(logP, logNorm), logNorm.sum()
+
+	def logJoint(self, indicator):
+	    '''
+	    The log-probability log P(y_i, m) of the objects in the rows of indicator and every component m
+	    '''
+	    M = self.alpha.shape[0]
+	    with np.errstate(divide='ignore'):
+	        logV = np.log(self.V.transpose(1,0,2).reshape(M, indicator.shape[1]))
+	        logAlpha = np.log(self.alpha)
+	    #only the stored entries of the indicator are multiplied, so log(0) of absent labels never enters the sum
+	    return np.asarray(indicator.dot(logV.T)) + logAlpha
+
+	def posterior(self, logP, logNorm):
+	    '''
+	    Normalize log P(y_i, m) into the posterior of each component. An object that has probability 0 under every 
+	    component gets a uniform posterior
+	    '''
+	    M = logP.shape[1]
+	    ExpZ = np.full(logP.shape, 1./M)
+	    possible = np.isfinite(logNorm)
+	    ExpZ[possible] = np.exp(logP[possible] - logNorm[possible,None])
+	    return ExpZ
+
 
 	def maximization(self):
 	    '''
 	    Update the parameters taking into account the ExpZ computed in the 
-	    Expectation (ExpZ) step.
+	    Expectation (ExpZ) step. v(j,m,k) is the share of the posterior of component m that falls on the objects 
+	    labeled k in partition j, read off one product of the one-hot labels with ExpZ. A component with no posterior 
+	    left gets uniform v.
 	    Obs: y(N,H) Kj(H) alpha(M) v(H,M,K(j)) ExpZ(N,M)
 	    '''
-	    def vecSigma(vec, k):
-		    '''
-		    Compare i-th elements of vector to k assigining to 
-		    a vector 1 if i-th == k, 0 otherwise. 
+	    self.alpha = self.ExpZ.sum(axis=0) / self.ExpZ.sum()
+	    self.V = self.updateV(np.asarray(self.indicator.T.dot(self.ExpZ)))
+	    return self.alpha, self.V
 
-		    '''
-		    aux = []
-		    for i in vec:
-		        if i == k:
-		            aux.append(1)
-		        else:
-		            aux.append(0)
-		    return np.asarray(aux)
-
-
-	    def updateAlpha():
-	        for m in range(self.alpha.shape[0]):
-	            self.alpha[m] = float(sum(self.ExpZ[:,m])) / float(sum(sum(self.ExpZ)))
-	        return self.alpha
-	    
-	    def updateV():
-	        
-	        for j in range(self.y.shape[1]):
-	            for m in range(self.alpha.shape[0]):
-	                ix = 0
-	                for k in self.K[j]:
-	                    num = sum(vecSigma(self.y.iloc[:,j],k) * np.array(self.ExpZ[:,m]))
-	                    den = 0
-	                    for kx in self.K[j]:
-	                        den += sum(vecSigma(self.y.iloc[:,j],kx) * np.asarray(self.ExpZ[:,m]))
-	                    self.v[j][m][ix] = float(num) / float(den)
-	                    ix += 1
-	                            
-	        return self.v
-	                
-	    self.alpha = updateAlpha()
-	    self.v = updateV()
-	    return self.alpha, self.v
+	def miniBatchEM(self):
+	    '''
+	    One pass of stepwise EM over the objects in shuffled batches. The statistics of each batch, the mean posterior 
+	    of the components and the mean weighted counts of every cluster, are blended into running statistics with step 
+	    size (t+1)^-step_decay, and alpha and v are updated from the running statistics after every batch.
+	    Returns the log-likelihood of the batches, each under the parameters it was seen with.
+	    '''
+	    random = np.random if self.random is None else self.random
+	    order = random.permutation(self.N)
+	    logLikelihood = 0
+	    for start in range(0, self.N, self.batch_size):
+	        rows = np.sort(order[start:start + self.batch_size])
+	        ExpZ, batchLikelihood = self.expectationRows(rows)
+	        logLikelihood += batchLikelihood
+	        stepSize = (self.nSteps + 1.) ** -self.step_decay
+	        batchAlpha = ExpZ.mean(axis=0)
+	        batchCounts = np.asarray(self.indicator[rows].T.dot(ExpZ)) / len(rows)
+	        if self.nSteps == 0:
+	            self.statsAlpha, self.statsCounts = batchAlpha, batchCounts
+	        else:
+	            self.statsAlpha = (1 - stepSize) * self.statsAlpha + stepSize * batchAlpha
+	            self.statsCounts = (1 - stepSize) * self.statsCounts + stepSize * batchCounts
+	        self.nSteps += 1
+	        self.alpha = self.statsAlpha / self.statsAlpha.sum()
+	        self.V = self.updateV(self.statsCounts)
+	    return logLikelihood
+
+	def updateV(self, counts):
+	    '''
+	    Set V from the weighted counts (H*max K(j) x M) of every cluster of every partition under every component. 
+	    Where a component has no weight left on a partition, v(j,m) is uniform over the clusters of the partition
+	    '''
+	    H, M = len(self.K), counts.shape[1]
+	    counts = counts.reshape(H, self.maxK, M).transpose(0,2,1)
+	    total = counts.sum(axis=2, keepdims=True)
+	    uniform = self.mask[:,None,:] / np.maximum(self.nClusters, 1)[:,None,None].astype(float)
+	    with np.errstate(invalid='ignore', divide='ignore'):
+	        V = np.where(total > 0, counts / total, uniform)
+	    return V * self.mask[:,None,:]
 
 
 	def emProcess(self):
+		'''
+		Run expectation maximization, from n_init random starts, and assign each object to its most likely component
+		'''
+		if self.seeds is not None and len(self.seeds) > 1:
+			return self.restarts()
 		
 		def piConsensus():
 		    '''
-		    The function outputs the final ensemble solution based on ExpZ values.
+		    The function outputs the final ensemble solution based on ExpZ values. piFinishing lists all components 
+		    of maximal ExpZ of each object, and the label is the first of them.
 		    '''
-		    maxExpZValues = {}
+		    best = self.ExpZ.max(axis=1)
 		    piFinishing = {}
-		    labels = []
 		    for i in range(self.ExpZ.shape[0]):
-		        maxExpZValues[i] = max(self.ExpZ[i,:]) 
 		        piFinishing[i] = []
-		        
-		        for j in range(self.ExpZ.shape[1]):
-		            if (maxExpZValues[i] == self.ExpZ[i,j]):
-		                piFinishing[i].append(j + 1)
-		                labels.append(j+1)
-		    
-		    # choose randomly in the case of same values of ExpZ[i,:]          
-		    #[piFinishing[i].delete(random.choice(piFinishing[i])) for i in piFinishing.keys() if (len(piFinishing[i]) > 1)]             
+		    rows, cols = np.nonzero(self.ExpZ == best[:,None])
+		    for i, j in zip(rows.tolist(), cols.tolist()):
+		        piFinishing[i].append(j + 1)
+		    labels = np.argmax(self.ExpZ, axis=1) + 1
 		    return piFinishing, labels
 		
 		i = 0
+		previous = -np.inf
+		self.converged = False
+		self.nSteps = 0
 		while(i<self.iterations):
-			self.ExpZ = self.expectation()
-			self.alpha, self.v = self.maximization()
+			if self.batch_size is None:
+				self.ExpZ = self.expectation()
+				self.alpha, self.V = self.maximization()
+			else:
+				self.logLikelihood = self.miniBatchEM()
 			i += 1
+			if self.tol is not None and abs(self.logLikelihood - previous) < self.tol:
+				self.converged = True
+				break
+			previous = self.logLikelihood
+		self.nIterations = i
+		if self.batch_size is not None: #the final assignment is a full pass
+			self.ExpZ = self.expectation()
 
 		piFinishing, labels = piConsensus()
 		self.piFinishing = piFinishing
@@ -265,6 +411,35 @@ class mixture_model:
 		#	return piFinishing, labels
 		return self.labels
 
+	def restarts(self):
+		'''
+		Run emProcess from every seed in self.seeds, in a process pool if n_jobs is not 1, and keep the model with the 
+		highest log-likelihood (the first of equals)
+		'''
+		jobs = [(self.parg, self.N, self.nEnsCluster, self.iterations, self.tol, seed, self.batch_size, self.step_decay) 
+			for seed in self.seeds]
+		if co.num_jobs(self.n_jobs) == 1:
+			models = [run_restart(job) for job in jobs]
+		else:
+			with ProcessPoolExecutor(max_workers=min(co.num_jobs(self.n_jobs), len(jobs))) as pool:
+				models = list(pool.map(run_restart, jobs))
+		best = models[int(np.argmax([model.logLikelihood for model in models]))]
+		for attribute in ['alpha', 'V', 'ExpZ', 'logLikelihood', 'labels', 'piFinishing', 'nIterations', 'converged', 'random']:
+			setattr(self, attribute, getattr(best, attribute))
+		self.logLikelihoods = [model.logLikelihood for model in models]
+		return self.labels
+
+def run_restart(job):
+	'''
+	Fit one restart (parg, N, nEnsCluster, iterations, tol, seed, batch_size, step_decay) of a mixture model, in a 
+	worker process
+	'''
+	parg, N, nEnsCluster, iterations, tol, seed, batch_size, step_decay = job
+	model = mixture_model(parg, N, nEnsCluster=nEnsCluster, iterations=iterations, tol=tol, seed=seed, 
+		batch_size=batch_size, step_decay=step_decay)
+	model.emProcess()
+	return model
+
 class co_occurrence_linkage:
 	"""
 	Returns a final solution to the ensemble that is the agglomerative clustering of the co_occurrence matrix 
@@ -275,8 +450,9 @@ class co_occurrence_linkage:
 	co_occ_object: openensembles.coMat object
 		The co-occurrence object to operate on
 
-	threshold: float
-		The threshold to cut the linkage at to create hard partitions
+	threshold: float or 'auto'
+		The threshold to cut the linkage at to create hard partitions. If 'auto', the threshold is chosen by the maximal 
+		lifetime criterion (see coMat.lifetime_threshold()) and stored in threshold on finish()
 
 	linkage: string
 		linkage type. See `scipy.cluster.hierarchy <https://docs.scipy.org/doc/scipy/reference/generated/scipy.cluster.hierarchy.linkage.html#scipy.cluster.hierarchy.linkage>`_
@@ -293,11 +469,20 @@ class co_occurrence_linkage:
 	"""
 	def __init__(self, co_occ_object, threshold, linkage='average'):
 		self.coMat = co_occ_object
-		self.N = len(self.coMat.co_matrix)
+		self.N = self.coMat.N
 		self.labels = np.empty(self.N)
 		self.K= 0 #number of clusters made by the cut, to be replaced
 		self.linkage = linkage
 		self.threshold = threshold
+		self.lnk = None
+
+	def link(self):
+		"""
+		The linkage of the co-occurrence matrix, calculated on the first call and kept in self.lnk for every later cut
+		"""
+		if self.lnk is None:
+			self.lnk = self.coMat.link(linkage=self.linkage)
+		return self.lnk
 
 	def finish(self):
 		"""
@@ -305,12 +490,99 @@ class co_occurrence_linkage:
 		According to self.linkage (linkage parameter set in initialization of object) with clusters equal to self.K (also set in intialization)
 		"""
 		#first get linkage, then cut
-		lnk = self.coMat.link(linkage=self.linkage)
+		lnk = self.link()
+		if isinstance(self.threshold, str):
+			if self.threshold != 'auto':
+				raise ValueError("ERROR: threshold %s not recognized, use a float or 'auto'"%(self.threshold))
+			self.threshold = self.coMat.lifetime_threshold(lnk)
 		labels = self.coMat.cut(lnk, self.threshold)
 		self.K = len(np.unique(labels)) 
 		self.labels = labels
 		return self.labels
 
+	def sweep(self, thresholds=None, n_clusters=None):
+		"""
+		Cut the linkage, calculated once, at every threshold in thresholds or into every number of clusters in 
+		n_clusters. See coMat.cut_sweep()
+
+		Returns
+		-------
+		labels: matrix of ints
+			One solution (row) for every threshold or number of clusters
+		K: array of ints
+			The number of clusters of every solution, e.g. to plot the lifetime of the numbers of clusters
+		"""
+		return self.coMat.cut_sweep(self.link(), thresholds=thresholds, n_clusters=n_clusters)
+
+class single_link_mst:
+	"""
+	Returns a final solution to the ensemble that is the single linkage (evidence accumulation) clustering of the 
+	co-occurrence matrix, cut at a distance threshold, where the distance of a pair of objects is 1 - co-occurrence. 
+	Only the pairs within the threshold are read from the co-occurrence counts, as a sparse graph, and the clusters are 
+	the components of the minimum spanning forest of that graph. The partition is the one that single linkage on the 
+	dense matrix, cut at the same threshold, produces (see co_occurrence_linkage), without the O(N^2) linkage.
+
+	Parameters
+	----------
+	co_occ_object: openensembles.coMat object
+		The co-occurrence object to operate on, dense, sparse or memory-mapped
+
+	threshold: float
+		The linkage distance to cut at. Objects closer than or at threshold are joined
+
+	Attributes
+	----------
+	labels: list of ints
+		The final solution, with clusters numbered from 1 in order of their first object
+	K: int
+		The number of clusters
+	mst: scipy.sparse.csr_matrix
+		The minimum spanning forest of the thresholded graph. Edge weights are nEnsembles - counts + 1, so that pairs at 
+		distance 0 are kept as edges. It is empty when threshold >= 1, since every pair is then joined
+
+	See Also
+	--------
+	openensembles.cluster.finish_single_link()
+
+	"""
+	def __init__(self, co_occ_object, threshold):
+		self.coMat = co_occ_object
+		self.N = self.coMat.N
+		self.labels = np.empty(self.N)
+		self.K = 0
+		self.threshold = threshold
+		self.mst = None
+
+	def finish(self):
+		"""
+		Threshold the co-occurrence into a sparse graph, build its minimum spanning forest and return its components as the labels
+		"""
+		n = self.coMat.nEnsembles
+		rows = []
+		cols = []
+		weights = []
+		if self.threshold < 1:
+			for i, j, counts in self.coMat.iter_upper_pairs():
+				#distances exactly as coMat.condensed_distance calculates them
+				keep = 1 - counts/float(n) <= self.threshold
+				rows.append(i[keep])
+				cols.append(j[keep])
+				weights.append(n - counts[keep].astype(np.int64) + 1)
+		if rows:
+			rows, cols, weights = np.concatenate(rows), np.concatenate(cols), np.concatenate(weights)
+		else:
+			rows = cols = weights = np.zeros(0, dtype=np.int64)
+		graph = sps.csr_matrix((weights, (rows, cols)), shape=(self.N, self.N))
+		self.mst = csgraph.minimum_spanning_tree(graph).tocsr()
+		if self.threshold >= 1:
+			#every pair of objects, including those that never co-cluster, is within the threshold
+			labels = np.zeros(self.N, dtype=int)
+		else:
+			labels = csgraph.connected_components(self.mst, directed=False)[1]
+		self.labels = labels + 1
+		self.K = len(np.unique(self.labels))
+		return self.labels
+
 class majority_vote:
 	"""
 	Based on Ana Fred's 2001 paper, 
@@ -321,8 +593,9 @@ class majority_vote:
 
 	Parameters
 	----------
-	co_occ_object: openensembles.coMat object
-		The co-occurrence object to operate on
+	co_occ_matrix: openensembles.coMat object, pandas dataframe, scipy.sparse matrix or openensembles.cooccurrence.tiled_matrix
+		The co-occurrence object or matrix (openensembles.coMat.co_matrix) to operate on. A coMat object is thresholded 
+		from its integer counts
 
 	threshold: float
 		The threshold, fraction of times any pair of objects clusters together that is considred for majority.
@@ -346,82 +619,360 @@ class majority_vote:
 	def __init__(self, co_occ_matrix, threshold=0.5):
 		self.co_matrix = co_occ_matrix
 		self.K= 0 #number of clusters made 
-		self.N = len(co_occ_matrix)
+		self.N = matrix_size(co_occ_matrix)
 		self.labels = np.empty(self.N)
 		self.threshold=threshold
 
 
 	def finish(self):
 		"""
-		Finish the ensemble by majority vote
+		Finish the ensemble by majority vote. The original algorithm scans all pairs of objects, gives every object a 
+		cluster number in order of appearance and merges the clusters of pairs above threshold into the lower number. 
+		The result is the connected components of the pairs above threshold, numbered in order of their first object, 
+		which is found here with a disjoint-set forest over only the pairs above threshold (see union_find).
 		"""
-		labels = np.zeros(self.N).astype(int)
-		currCluster = 1
-		x = self.co_matrix.as_matrix()
-
-		for i in range(0, self.N):
-			for j in range(i+1, self.N):
-
-				if x[i,j] > self.threshold:
-					# the clusters should be set to the same value and if both belong to an existing cluster, all 
-					# members of the clusters should be joined
-					if labels[i] and labels[j]:
-						cluster_num = min(labels[i] , labels[j])
-						cluster_toChange = max(labels[i] , labels[j])
-
-						indices = [k for k, x in enumerate(labels) if x == cluster_toChange]
-						labels[indices] = cluster_num
-					elif not labels[i] and not labels[j]: #a new cluster
-						labels[i] = currCluster
-						labels[j] = currCluster
-						currCluster += 1
-					else: #one of them is in a cluster and one is not, one will be assigned the same thing, but saves an if
-						cluster_num = max(labels[i] , labels[j])
-						labels[i] = cluster_num
-						labels[j] = cluster_num
-
-				else: #else don't join them and give them an assignment the first time they are traversed
-					if not labels[i]:
-						labels[i] = currCluster
-						currCluster += 1
-					if not labels[j]:
-						labels[j] = currCluster
-						currCluster += 1
-
-		#Add a cleanup state, if there are any cluster numbers that jump, move them down
-		clusters = np.sort(np.unique(labels))
-		for ind in range(0,len(clusters)-1): #operating on ind+1
-			if clusters[ind+1] != clusters[ind]+1:
-
-				cluster_num = clusters[ind] + 1
-				#print("updating cluster num %d to %d")%(clusters[ind+1], cluster_num)
-				indices = [k for k, x in enumerate(labels) if x == clusters[ind+1]]
-				labels[indices] = cluster_num
-				clusters[ind+1] = cluster_num 
+		self.labels = self.finish_edges()
+		self.K = len(np.unique(self.labels))
+		return self.labels
 
+	def finish_edges(self):
+		"""
+		Majority vote from the pairs of objects above threshold, read from the co-occurrence without a loop over all pairs
 
+		Returns
+		-------
+		labels: list of ints
+			Solution of cluster assignments
+		"""
+		if self.N < 2:
+			return np.zeros(self.N).astype(int)
+		rows, cols = threshold_edges(self.co_matrix, self.threshold, strict=True)
+		roots = union_find(self.N, rows, cols)
+		#the root of every component is its first object, so numbering the roots in order keeps the original numbering
+		clusters, labels = np.unique(roots, return_inverse=True)
+		return labels + 1
 
 
+class signature_majority_vote:
+	"""
+	Majority vote (see majority_vote) calculated from the clustering solutions directly rather than from a co-occurrence 
+	matrix. Objects with the same labels in every solution (the same signature) co-cluster every time, so the objects 
+	are first collapsed into groups of unique signatures, and the fraction of solutions that agree on the labels of two 
+	groups is their co-occurrence. The cost scales with the number of distinct signatures G (G^2 x nEnsembles 
+	comparisons, made a block of groups at a time) rather than with N^2, and the labels are the same as majority_vote's.
 
-		self.labels = labels
+	Parameters
+	----------
+	parg: list of lists of ints
+		Solutions of assignments of objects to clusters across an ensemble
+	N: int
+		Number of objects
+	threshold: float
+		The threshold, fraction of times any pair of objects clusters together that is considred for majority.
+		Default 0.5
+	block_size: int
+		Number of groups compared to all others at a time. Default None, which keeps a block to about 2**24 comparisons
+
+	Attributes
+	----------
+	K: int
+		Number of clusters created
+	labels: list of ints
+		Solution of cluster assignments
+	groups: array of ints
+		The signature group of each object
+
+	See Also
+	--------
+	openensembles.cluster.finish_majority_vote()
+	"""
+	def __init__(self, parg, N, threshold=0.5, block_size=None):
+		self.parg = parg
+		self.N = N
+		self.K = 0
+		self.labels = np.empty(self.N)
+		self.threshold = threshold
+		self.block_size = block_size
+		self.groups = None
+
+	def finish(self):
+		"""
+		Finish the ensemble by majority vote between signature groups
+		"""
+		if self.N < 2:
+			self.labels = np.zeros(self.N).astype(int)
+			self.K = len(np.unique(self.labels))
+			return self.labels
+		nEnsembles = len(self.parg)
+		solutions = np.column_stack([np.asarray(solution) for solution in self.parg])
+		signatures, groups = np.unique(solutions, axis=0, return_inverse=True)
+		self.groups = groups.ravel()
+		if not 1 > self.threshold: 
+			#not even objects of the same signature pass, so every object is alone
+			self.labels = np.arange(1, self.N+1)
+			self.K = self.N
+			return self.labels
+
+		G = signatures.shape[0]
+		block_size = self.block_size
+		if block_size is None:
+			block_size = max(1, 2**24//(G*nEnsembles))
+		rows = []
+		cols = []
+		for start in range(0, G, block_size):
+			block = signatures[start:start+block_size]
+			agree = (block[:,None,:] == signatures[None,start:,:]).sum(axis=2)
+			passed = np.triu(agree/float(nEnsembles) > self.threshold, k=1)
+			i, j = np.nonzero(passed)
+			rows.append(i + start)
+			cols.append(j + start)
+		roots = union_find(G, np.concatenate(rows), np.concatenate(cols))
+
+		#number the clusters in order of their first object, as majority_vote does
+		clusters, first, labels = np.unique(roots[self.groups], return_index=True, return_inverse=True)
+		rank = np.argsort(np.argsort(first))
+		self.labels = rank[labels.ravel()] + 1
+		self.K = len(clusters)
+		return self.labels
+
+class mcla:
+	"""
+	The Meta-CLustering Algorithm (MCLA) of Strehl and Ghosh. Every cluster of every solution is a column of the sparse 
+	N x C indicator matrix of the ensemble (C clusters in total). The clusters are clustered into K meta-clusters by 
+	their Jaccard similarity, and every object is assigned to the meta-cluster it is most associated with, i.e. that 
+	holds the largest share of the clusters it belongs to. No co-occurrence of objects is calculated: the cost is 
+	linear in N (one product of the indicator matrix with its transpose, and one with the meta-cluster membership) 
+	plus the C^2 cost of meta-clustering.
+
+	Parameters
+	----------
+	parg: list of lists of ints
+		Solutions of assignments of objects to clusters across an ensemble
+	N: int
+		Number of objects
+	K: int
+		Number of meta-clusters. Default None, the median number of clusters of the solutions
+	linkage: string
+		Linkage used to cluster the clusters, on the distance 1 - Jaccard similarity. See scipy.cluster.hierarchy.linkage.
+		Default 'average'
+
+	Attributes
+	----------
+	K: int
+		Number of clusters created, at most the number of meta-clusters as meta-clusters that win no object are dropped
+	labels: list of ints
+		Solution of cluster assignments
+	metaLabels: array of ints
+		The meta-cluster (1..K) of every cluster, in the column order of the indicator matrix
+	association: matrix of floats
+		The association of every object with every meta-cluster (N x K), the fraction of the clusters of the 
+		meta-cluster the object belongs to
+
+	Notes
+	-----
+	Strehl and Ghosh partition the meta-graph with METIS, here the clusters are agglomerated with scipy's linkage. 
+	Ties in the association go to the lowest meta-cluster, and the final clusters are numbered by their first object.
+
+	References
+	----------
+	Strehl, Alexander, and Joydeep Ghosh. Cluster Ensembles - A Knowledge Reuse Framework for Combining Multiple 
+	Partitions. Journal of Machine Learning Research 3 (2002): 583-617.
+
+	See Also
+	--------
+	openensembles.cluster.finish_mcla()
+	"""
+	def __init__(self, parg, N, K=None, linkage='average'):
+		self.parg = parg
+		self.N = N
+		self.nMeta = K
+		self.K = 0
+		self.labels = np.empty(self.N)
+		self.linkage = linkage
+		self.metaLabels = None
+		self.association = None
+
+	def finish(self):
+		"""
+		Meta-cluster the clusters of the ensemble and assign every object to its most associated meta-cluster
+		"""
+		B = sps.csc_matrix(co.indicator_matrix(self.parg, self.N), dtype=np.float64)
+		C = B.shape[1]
+		if C == 0 or self.N == 0:
+			self.labels = np.ones(self.N, dtype=int)
+			self.K = min(1, self.N)
+			return self.labels
+		nMeta = self.nMeta
+		if nMeta is None:
+			nMeta = int(np.median([len(np.unique(solution)) for solution in self.parg]))
+		if nMeta < 1:
+			raise ValueError("ERROR: MCLA needs at least one meta-cluster, K=%d"%(nMeta))
+
+		#Jaccard similarity of all pairs of clusters, from the sizes and overlaps of the indicator columns
+		overlap = (B.T.dot(B)).toarray()
+		size = np.diag(overlap).copy()
+		with np.errstate(invalid='ignore', divide='ignore'):
+			jaccard = overlap / (size[:,None] + size[None,:] - overlap)
+		jaccard[~np.isfinite(jaccard)] = 0
+		if C > 1:
+			dist = ssd.squareform(1 - jaccard, checks=False)
+			self.metaLabels = sch.fcluster(sch.linkage(dist, method=self.linkage), nMeta, 'maxclust')
+		else:
+			self.metaLabels = np.ones(1, dtype=int)
+
+		#mean membership of each object in the clusters of each meta-cluster
+		meta = self.metaLabels - 1
+		metaSize = np.bincount(meta)
+		membership = sps.csr_matrix((1./metaSize[meta], (np.arange(C), meta)), shape=(C, len(metaSize)))
+		self.association = np.asarray(B.dot(membership).todense())
+		winner = np.argmax(self.association, axis=1)
+		#number the clusters by their first object
+		_, first, labels = np.unique(winner, return_index=True, return_inverse=True)
+		self.labels = np.argsort(np.argsort(first))[labels.ravel()] + 1
+		self.K = len(np.unique(self.labels))
+		return self.labels
+
+class alignment_vote:
+	"""
+	Plurality vote after aligning the labels of every solution to a reference partition. The clusters of each solution 
+	are matched one to one with the clusters of the reference by the Hungarian algorithm on their K x K contingency 
+	table (maximizing the number of shared objects), every object then takes the label most of the aligned solutions 
+	give it, and the vote becomes the reference of the next round until the labels stop changing. The cost is 
+	O(N x nEnsembles) per round plus O(K^3) per solution, and no co-occurrence matrix is built, so this suits ensembles 
+	of solutions with a similar number of clusters, e.g. kmeans with a fixed K.
+
+	Parameters
+	----------
+	parg: list of lists of ints
+		Solutions of assignments of objects to clusters across an ensemble
+	N: int
+		Number of objects
+	reference: int
+		The index in parg of the first reference solution. Default 0
+	iterations: int
+		Largest number of rounds of alignment and voting. Default 10
 
+	Attributes
+	----------
+	K: int
+		Number of clusters created
+	labels: list of ints
+		Solution of cluster assignments
+	votes: matrix of ints
+		The number of solutions that give every object (rows) every label (columns) in the last round. Clusters of a 
+		solution with no match in the reference get labels after those of the reference
+	nIterations: int
+		The number of rounds run
 
+	Notes
+	-----
+	Ties in the vote go to the lowest label, and the final clusters are numbered by their first object.
 
+	See Also
+	--------
+	openensembles.cluster.finish_alignment_vote()
+	"""
+	def __init__(self, parg, N, reference=0, iterations=10):
+		self.parg = parg
+		self.N = N
+		self.K = 0
+		self.labels = np.empty(self.N)
+		self.reference = reference
+		self.iterations = iterations
+		self.votes = None
+		self.nIterations = 0
 
+	def finish(self):
+		"""
+		Align every solution to the reference and vote, until the vote no longer changes
+		"""
+		codes = []
+		for solution in self.parg:
+			if len(solution) != self.N:
+				raise ValueError("ERROR: solution has %d labels, but there are %d objects"%(len(solution), self.N))
+			codes.append(np.unique(solution, return_inverse=True)[1].ravel())
+		if not codes:
+			self.labels = np.ones(self.N, dtype=int)
+			self.K = min(1, self.N)
+			return self.labels
+
+		labels = codes[self.reference]
+		self.nIterations = 0
+		while self.nIterations < self.iterations:
+			votes = self.vote(codes, labels)
+			consensus = np.unique(np.argmax(votes, axis=1), return_inverse=True)[1].ravel()
+			self.votes = votes
+			self.nIterations += 1
+			if np.array_equal(consensus, labels):
+				break
+			labels = consensus
+
+		#number the clusters by their first object
+		_, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+		self.labels = np.argsort(np.argsort(first))[inverse.ravel()] + 1
+		self.K = len(first)
+		return self.labels
 
+	def vote(self, codes, reference):
+		"""
+		The votes of all solutions (coded 0..K-1) for every object, after matching the clusters of each solution to 
+		those of the reference
+		"""
+		Kr = reference.max() + 1
+		Kmax = max(code.max() + 1 for code in codes)
+		votes = np.zeros((self.N, Kr + Kmax), dtype=np.int64)
+		objects = np.arange(self.N)
+		for code in codes:
+			Ks = code.max() + 1
+			table = np.bincount(code * Kr + reference, minlength=Ks * Kr).reshape(Ks, Kr)
+			rows, cols = linear_sum_assignment(table, maximize=True)
+			mapping = np.empty(Ks, dtype=np.int64)
+			mapping[rows] = cols
+			unmatched = np.setdiff1d(np.arange(Ks), rows)
+			mapping[unmatched] = Kr + np.arange(len(unmatched))
+			#every object has one label per solution, so the pairs are unique and += counts each once
+			votes[objects, mapping[code]] += 1
+		return votes
 
 class graph_closure:
 	"""
 	Returns a final solution of the ensemble based on treating the co-occurrence matrix as a weighted graph whose 
-	solution is found from identifying network components within the graph
+	solution is found from identifying network components within the graph. The graph is built from the list of pairs 
+	at or above threshold, never from a dense adjacency matrix. Objects that are in no percolated clique are each given 
+	their own cluster.
 
 	Finds k-percolated cliques in G, e.g,
     Unless the cliques argument evaluates to True, this algorithm
     first enumerates all cliques in G. These are stored in memory,
     which in large graphs can consume large amounts of memory.
     Returns a generator object. To return a list of percolated k-cliques,
+
+	Parameters
+	----------
+	co_occ_matrix: openensembles.coMat object, pandas dataframe, scipy.sparse matrix or openensembles.cooccurrence.tiled_matrix
+		The co-occurrence object or matrix to operate on
+	threshold: float
+		Co-occurrence fraction at or above which a pair of objects is joined by an edge
+	clique_size: int
+		Size of the cliques to percolate. Default 3
+	engine: string {'stream', 'clique_graph'}
+		How cliques are percolated. 'clique_graph' (default) is the original method, which keeps all cliques and a graph 
+		of all pairs of percolating cliques in memory. 'stream' percolates one connected component of the graph at a 
+		time, reading its cliques one at a time into a union-find over cliques, and keeps only the cliques each object 
+		of the component belongs to. It labels objects in overlapping percolated cliques differently, see Notes. 
+		Default 'clique_graph'
+	n_jobs: int
+		With the 'stream' engine, the number of processes that percolate the connected components of the graph in 
+		parallel. The labels do not depend on n_jobs. -1 uses all cores. Default 1
+
     Notes
     -----
+    Both engines find the same percolated cliques. The 'stream' engine labels them independently of the order the 
+    cliques are found in: an object in two overlapping percolated cliques goes to the one whose sorted members come 
+    first (the one with the smallest member), and clusters are numbered in that order, followed by the objects in no 
+    percolated clique. 'clique_graph' gives an object in overlapping percolated cliques to the first one networkx 
+    finds, so the two engines can differ on such objects. The memory of the 'stream' engine grows with the edges of 
+    the graph and the clique memberships of the largest connected component, not with all cliques of the graph.
 
     References
     ----------
@@ -433,14 +984,19 @@ class graph_closure:
 	openensembles.cluster.finish_graph_closure()
 
 	"""
-	def __init__(self, co_occ_matrix, threshold, clique_size = 3):
+	def __init__(self, co_occ_matrix, threshold, clique_size = 3, engine='clique_graph', n_jobs=1):
+		if engine not in ['stream', 'clique_graph']:
+			raise ValueError("ERROR: percolation engine %s not recognized, use one of stream/clique_graph"%(engine))
 		self.co_matrix = co_occ_matrix
 		self.K= 0 #number of clusters made 
-		self.N = len(co_occ_matrix)
+		self.N = matrix_size(co_occ_matrix)
 		self.labels = np.empty(self.N)
 		self.threshold = threshold
-		self.coMat_binary = np.array(self.co_matrix >= threshold).astype(int)
+		#the edges (rows, cols) of all pairs at or above threshold, upper triangle only
+		self.coMat_binary = threshold_edges(co_occ_matrix, threshold, strict=False)
 		self.clique_size = clique_size
+		self.engine = engine
+		self.n_jobs = n_jobs
 
 	def finish(self):
 		""" Finishes the ensemble by taking a binary adjacency matrix, defined in initilization according to the threshold given
@@ -480,17 +1036,299 @@ class graph_closure:
 		                adjacent_cliques.add(adj_clique)
 		    return adjacent_cliques
 
-		G = nx.from_numpy_matrix(self.coMat_binary)
+		rows, cols = self.coMat_binary
+		if self.clique_size <= 2:
+			#every edge is in a percolated 2-clique, so the clusters are the connected components of the graph
+			graph = sps.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(self.N, self.N))
+			self.K, self.labels = csgraph.connected_components(graph, directed=False)
+			return self.labels
+
+		if self.engine == 'stream':
+			self.labels = self.finish_stream()
+			self.K = len(np.unique(self.labels))
+			return self.labels
+
+		G = edge_graph(range(self.N), rows, cols)
 		y = get_percolated_cliques(G, self.clique_size)
 		z = list(y)
+		labels = np.full(self.N, -1)
 		clusterNum = 0
 		while z:
 		    l = list(z.pop())
-		    self.labels[l] = int(clusterNum)
+		    labels[l] = int(clusterNum)
 		    clusterNum+=1
-		self.labels = self.labels.astype(int)
+		#objects outside of all percolated cliques are clusters of their own
+		alone = labels < 0
+		labels[alone] = np.arange(clusterNum, clusterNum + alone.sum())
+		self.labels = labels
+		self.K = len(np.unique(labels))
 
 		return self.labels
 
+	def finish_stream(self):
+		"""
+		Percolate the cliques of each connected component of the graph (see percolate_component), one component at a 
+		time, or in a process pool if n_jobs is not 1, and label the percolated cliques (see label_communities)
+
+		Returns
+		-------
+		labels: list of ints
+			Solution of cluster assignments
+		"""
+		rows, cols = self.coMat_binary
+		graph = sps.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(self.N, self.N))
+		nComponents, components = csgraph.connected_components(graph, directed=False)
+		members = np.argsort(components, kind='stable')
+		bounds = np.searchsorted(components[members], np.arange(nComponents+1))
+		#edges grouped by component, so that each job is a slice
+		edgeComponents = components[rows]
+		edgeOrder = np.argsort(edgeComponents, kind='stable')
+		edgeBounds = np.searchsorted(edgeComponents[edgeOrder], np.arange(nComponents+1))
+
+		def jobs():
+			#percolated cliques never span connected components, so each component is percolated on its own
+			for component in range(nComponents):
+				nodes = members[bounds[component]:bounds[component+1]]
+				if len(nodes) < self.clique_size:
+					continue
+				edges = edgeOrder[edgeBounds[component]:edgeBounds[component+1]]
+				yield (nodes, rows[edges], cols[edges], self.clique_size)
+
+		n_jobs = co.num_jobs(self.n_jobs)
+		communities = []
+		if n_jobs == 1:
+			for job in jobs():
+				communities.extend(percolate_component(job))
+		else:
+			with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+				for result in pool.map(percolate_component, jobs()):
+					communities.extend(result)
+		return label_communities(communities, self.N)
+
+
+def threshold_edges(co_matrix, threshold, strict=True, block_size=2048):
+	"""
+	Find the pairs of objects (i<j) whose co-occurrence passes a threshold, without making a sparse matrix dense.
+
+	Parameters
+	----------
+	co_matrix: openensembles.coMat object, pandas dataframe, array, scipy.sparse matrix or openensembles.cooccurrence.tiled_matrix
+		A square co-occurrence matrix. A tiled_matrix is read one tile at a time and the counts of a dense coMat object
+		a block of rows at a time
+	threshold: float
+		The co-occurrence threshold
+	strict: bool
+		If True pairs must be greater than threshold, otherwise greater than or equal to threshold. Default True
+	block_size: int
+		Number of rows of a coMat object's counts converted to fractions at a time. Default 2048
+
+	Returns
+	-------
+	rows: array of ints
+		The first object of each pair, ordered by rows and then columns
+	cols: array of ints
+		The second object of each pair
+
+	Raises
+	------
+	ValueError:
+		if co_matrix is sparse and the threshold would include pairs that never co-cluster
+	"""
+	def passes(x):
+		if strict:
+			return x > threshold
+		return x >= threshold
+
+	if isinstance(co_matrix, co.coMat):
+		if co_matrix.sparse or co_matrix.memmap_file:
+			co_matrix = co_matrix.co_matrix
+		else: #fractions of a block of rows at a time, never the whole matrix
+			rows = []
+			cols = []
+			for start in range(0, co_matrix.N, block_size):
+				passed = passes(co_matrix.counts[start:start+block_size]/float(co_matrix.nEnsembles))
+				i, j = np.nonzero(np.triu(passed, k=start+1))
+				rows.append(i + start)
+				cols.append(j)
+			if not rows:
+				return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+			return np.concatenate(rows), np.concatenate(cols)
+
+	if isinstance(co_matrix, co.tiled_matrix):
+		rows = []
+		cols = []
+		for rStart, cStart, counts in co_matrix.iter_tiles():
+			passed = passes(counts/float(co_matrix.nEnsembles))
+			if rStart == cStart:
+				passed = np.triu(passed, k=1)
+			i, j = np.nonzero(passed)
+			rows.append(i + rStart)
+			cols.append(j + cStart)
+		rows = np.concatenate(rows)
+		cols = np.concatenate(cols)
+		order = np.lexsort((cols, rows))
+		return rows[order], cols[order]
+
+	if sps.issparse(co_matrix):
+		if threshold < 0 or (threshold == 0 and not strict):
+			raise ValueError("ERROR: a threshold of %s on a sparse co-occurrence matrix includes pairs that never co-cluster"%(threshold))
+		upper = sps.triu(co_matrix, k=1).tocsr()
+		upper.sort_indices()
+		rows = np.repeat(np.arange(upper.shape[0]), np.diff(upper.indptr))
+		cols = upper.indices
+		keep = passes(upper.data)
+		return rows[keep], cols[keep]
+
+	rows, cols = np.nonzero(np.triu(passes(np.asarray(co_matrix)), k=1))
+	return rows, cols
+
+def edge_graph(nodes, rows, cols):
+	"""
+	An undirected networkx graph of nodes and the edges (rows, cols). Nodes are added first and edges in order, so that 
+	the graph and the order of its cliques are the same as from an adjacency matrix of the upper triangle
+	"""
+	G = nx.Graph()
+	G.add_nodes_from(nodes)
+	G.add_edges_from(zip(np.asarray(rows).tolist(), np.asarray(cols).tolist()))
+	return G
+
+def percolate_cliques(cliques, k):
+	"""
+	Percolate a stream of maximal cliques: cliques of at least k nodes that share k-1 nodes belong to the same 
+	percolated clique. Each clique is compared with the earlier cliques of its nodes by counting shared nodes, and 
+	joined to them in a union-find over cliques. Only the list of cliques of each node is kept, not the cliques or a 
+	graph of cliques.
 
+	Parameters
+	----------
+	cliques: iterable of lists of ints
+		Maximal cliques, as from networkx.find_cliques
+	k: int
+		Clique size, at least 2
 
+	Returns
+	-------
+	communities: list of arrays of ints
+		The sorted nodes of every percolated clique
+	"""
+	parent = []
+	membership = defaultdict(list)
+
+	def find(x):
+		root = x
+		while parent[root] != root:
+			root = parent[root]
+		while parent[x] != root:
+			parent[x], x = root, parent[x]
+		return root
+
+	for clique in cliques:
+		if len(clique) < k:
+			continue
+		clique_id = len(parent)
+		parent.append(clique_id)
+		shared = defaultdict(int)
+		for node in clique:
+			for other in membership[node]:
+				shared[other] += 1
+			membership[node].append(clique_id)
+		for other in shared:
+			if shared[other] >= k-1:
+				root, rootOther = find(clique_id), find(other)
+				if root != rootOther:
+					parent[max(root, rootOther)] = min(root, rootOther)
+
+	communities = defaultdict(set)
+	for node in membership:
+		for clique_id in membership[node]:
+			communities[find(clique_id)].add(node)
+	return [np.array(sorted(nodes), dtype=int) for nodes in communities.values()]
+
+def percolate_component(job):
+	"""
+	Percolate the cliques of one connected component (nodes, rows, cols, k) of a graph, with nodes sorted
+
+	Returns
+	-------
+	communities: list of arrays of ints
+		The sorted nodes of every percolated clique of the component (see percolate_cliques)
+	"""
+	nodes, rows, cols, k = job
+	G = edge_graph(range(len(nodes)), np.searchsorted(nodes, rows), np.searchsorted(nodes, cols))
+	return [nodes[community] for community in percolate_cliques(nx.find_cliques(G), k)]
+
+def label_communities(communities, N):
+	"""
+	Label N objects by the percolated cliques (communities) they belong to, independently of the order the 
+	communities are given in. Communities are ranked by their sorted members (so by their smallest member first), an 
+	object in several communities goes to the first ranked, and the communities that keep objects are numbered in 
+	rank order. Objects in no community are then numbered in order, each as a cluster of its own.
+
+	Parameters
+	----------
+	communities: list of arrays of ints
+		The sorted members of every community
+	N: int
+		Number of objects
+
+	Returns
+	-------
+	labels: array of ints
+		The cluster of every object, from 0
+	"""
+	labels = np.full(N, -1)
+	for rank, community in enumerate(sorted(communities, key=lambda members: members.tolist())):
+		free = community[labels[community] < 0]
+		labels[free] = rank
+	inClique = labels >= 0
+	labels[inClique] = np.unique(labels[inClique], return_inverse=True)[1].ravel()
+	nClusters = labels.max() + 1 if inClique.any() else 0
+	labels[~inClique] = np.arange(nClusters, nClusters + (~inClique).sum())
+	return labels
+
+def union_find(N, rows, cols):
+	"""
+	Find the connected components of a graph with a disjoint-set forest, vectorized over all edges at once. Each round 
+	hooks the root of the larger index of every edge onto the smaller root and then compresses all paths by pointer 
+	jumping, until both ends of every edge share a root.
+
+	Parameters
+	----------
+	N: int
+		Number of nodes
+	rows: array of ints
+		The first node of each edge
+	cols: array of ints
+		The second node of each edge
+
+	Returns
+	-------
+	roots: array of ints
+		The root of each node, which is the smallest node of its component
+	"""
+	parent = np.arange(N)
+	rows = np.asarray(rows, dtype=np.intp)
+	cols = np.asarray(cols, dtype=np.intp)
+	while len(rows):
+		rootsRows = parent[rows]
+		rootsCols = parent[cols]
+		joined = rootsRows != rootsCols
+		if not joined.any():
+			break
+		#only edges between different trees are left for the next round
+		rows, cols = rows[joined], cols[joined]
+		rootsRows, rootsCols = rootsRows[joined], rootsCols[joined]
+		np.minimum.at(parent, np.maximum(rootsRows, rootsCols), np.minimum(rootsRows, rootsCols))
+		grandparent = parent[parent]
+		while not np.array_equal(grandparent, parent):
+			parent = grandparent
+			grandparent = parent[parent]
+	return parent
+
+def matrix_size(co_matrix):
+	"""
+	The number of objects in a co-occurrence matrix or coMat object
+	"""
+	if isinstance(co_matrix, co.coMat):
+		return co_matrix.N
+	return co_matrix.shape[0]
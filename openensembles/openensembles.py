@@ -18,6 +18,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 import numpy as np 
 import pandas as pd 
+import scipy.sparse as sps
 import sklearn.cluster as skc
 import matplotlib.pyplot as plt
 import scipy.cluster.hierarchy as sch
@@ -26,6 +27,7 @@ import openensembles.transforms as tx
 import openensembles.clustering_algorithms as ca 
 import openensembles.finishing as finish
 import openensembles.cooccurrence as co
+import openensembles.cache as cache
 import openensembles.mutualinformation as mi
 import openensembles.validation as val
 import warnings
@@ -33,6 +35,7 @@ from random import randint
 import numpy.random as random
 import openensembles as oe
 from mpl_toolkits.mplot3d import Axes3D
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 class data:
     """
@@ -46,6 +49,10 @@ class data:
 
     x : list
         The x-axis elements. If x is a list of strings, it will be converted here to a list of ints (range 0 to len(x))
+
+    distance_cache_bytes : int
+        Memory cap, in bytes, of the cache of distance matrices of the data sources (see distance_matrix). Set to 0 to 
+        disable caching, or None for no cap. Default 2**30 (1GB)
     
     Attributes
     -----------
@@ -61,16 +68,20 @@ class data:
     x_labels : list
         a list of strings (if that was passed in) or the int and float. So that xticklabels could be updated or referenced
 
+    distance_cache : cache.memory_cache
+        Distance matrices by (source_name, metric), least recently used first, shared by all clusterings of the data
+
     Raises
     --------
     ValueError of the size of x and dimensionality of df do not match
     """
-    def __init__(self, df, x):
+    def __init__(self, df, x, distance_cache_bytes=2**30):
 
         self.df = df
         self.D = {}
         self.x = {}
         self.params = {}
+        self.distance_cache = cache.memory_cache(max_bytes=distance_cache_bytes)
 
         self.D['parent'] = np.asarray(df)
 
@@ -95,7 +106,40 @@ class data:
         self.x['parent'] = xVals
         self.params['parent'] = []
 
-       
+
+    def __setstate__(self, state):
+        #data objects pickled before the distance cache existed lack it
+        self.__dict__.update(state)
+        if 'distance_cache' not in self.__dict__:
+            self.distance_cache = cache.memory_cache()
+
+    def distance_matrix(self, source_name, distance='euclidean'):
+        """
+        The distance matrix of all pairs of objects of a data source, calculated once and then kept in distance_cache 
+        as long as the data source is unchanged and the cache has room. The clustering algorithms that work on distance 
+        matrices (DBSCAN, AffinityPropagation, Birch and spectral with a distance) read from the same cache.
+
+        Parameters
+        ----------
+        source_name: string
+            Name of the data source
+        distance: string
+            Distance metric. See clustering_algorithms.returnDistanceMatrix. Default 'euclidean'
+
+        Returns
+        -------
+        d: matrix
+            The read-only N x N distance matrix
+
+        Raises
+        ------
+        ValueError:
+            If the data source does not exist
+        """
+        if source_name not in self.D:
+            raise ValueError("ERROR: the source you requested does not exist by that name %s"%(source_name))
+        return ca.returnDistanceMatrix(self.D[source_name], distance, self.distance_cache, source_name)
+
     def transforms_available(self):
         """
         Returns a list of all transformations available
@@ -299,6 +343,18 @@ class cluster:
     ----------
     dataObj
         openensembles.data class -- consists at least of one data matrix called 'parent'
+    incremental: bool
+        If True, keep running co-occurrence counts as solutions are added by cluster() and removed by slice(), 
+        so that co-occurrence matrices and co-occurrence based finishing do not gather the whole ensemble again. Default False
+    sparse_counts: bool
+        If True, the running counts of incremental are a scipy.sparse.csr_matrix of int32 holding the pairs that co-cluster 
+        in at least one solution, which is smaller when most pairs never co-cluster. If False, they are an N x N matrix 
+        in the smallest unsigned integer type that holds the ensemble (see cooccurrence.count_dtype), 1 or 2 bytes per 
+        pair for up to 65535 solutions, and are updated in place. Default False
+    co_cache_bytes: int
+        Memory cap, in bytes, of the cache of co-occurrence matrices shared by co_occurrence_matrix() and the co-occurrence 
+        based finishing techniques, counting the co_matrix of a cached matrix once it has been read. Set to 0 to disable 
+        caching, or None for no cap. Default 2**30 (1GB)
     
     Returns
     -------
@@ -318,7 +374,15 @@ class cluster:
     clusterNumbers: dict of lists
         A listing of the unique set of cluster numbers produced in a clustering 
     random_state: dict of objects
-        A listing of the random state objects that can be used to reset the state and 
+        A listing of the random seeds of the solutions, which can be passed as random_seed to cluster() to repeat a 
+        solution: the int random_seed, or a numpy.random.SeedSequence drawn when no seed was passed. The full generator
+        is regenerated on demand by clustering_algorithms.random_generator()
+    co_counts: matrix of unsigned ints or scipy.sparse.csr_matrix
+        The running co-occurrence counts of the solutions in co_solutions, kept when incremental is True (see sparse_counts)
+    co_solutions: dict of arrays
+        Copies of the solutions counted in co_counts, so that labels changed in place are recounted
+    co_cache: cache.memory_cache
+        Co-occurrence matrices by the solutions they were built from and their storage options
 
     See also
     --------
@@ -338,7 +402,7 @@ class cluster:
     >>> c.cluster('pca', 'kmeans', 'kmeans_pca', 4)
 
     """
-    def __init__(self, dataObj):
+    def __init__(self, dataObj, incremental=False, co_cache_bytes=2**30, sparse_counts=False):
         self.dataObj = dataObj 
         self.labels= {} #key here is the name like HC_parent for hierarchically clustered parent
         self.data_source = {} # keep track of the key to the data source in object used
@@ -346,6 +410,23 @@ class cluster:
         self.algorithms = {} #keep track of the algorithm used
         self.clusterNumbers = {}
         self.random_state = {}
+        self.incremental = incremental
+        self.sparse_counts = sparse_counts
+        self.co_counts = None
+        self.co_solutions = {}
+        self.co_cache = cache.memory_cache(max_bytes=co_cache_bytes)
+        if incremental:
+            self.add_co_occurrence([])
+
+    def __setstate__(self, state):
+        #cluster objects pickled before incremental counts and the co-occurrence cache existed lack these attributes
+        self.__dict__.update(state)
+        self.__dict__.setdefault('incremental', False)
+        self.__dict__.setdefault('co_counts', None)
+        self.__dict__.setdefault('co_solutions', {})
+        self.__dict__.setdefault('sparse_counts', sps.issparse(self.co_counts))
+        if 'co_cache' not in self.__dict__:
+            self.co_cache = cache.memory_cache()
 
     def algorithms_available(self):
         """ 
@@ -399,8 +480,11 @@ class cluster:
         Require_Unique: bool
             If FALSE and you already have an output_name solution, this will append a number to create a unique name. If TRUE and a 
             solution by that name exists, this will not add solution and raise ValueError. Default Require_Unique=False
-        random_seed: int or random.getstate()
-            Pass a random seed or random seed state (random.getstate()) in order to force the starting point of a clustering algorithm to that state. 
+        random_seed: int, numpy.random.SeedSequence or numpy.random.get_state()
+            Pass a random seed or random seed state (e.g. from self.random_state) in order to force the starting point of a clustering algorithm to that state. 
+            Each call draws from its own generator, seeded from a fresh numpy.random.SeedSequence if random_seed is None, 
+            and numpy's global random state is not used, so clusterings can run in concurrent threads. Only the seed is 
+            stored, in self.random_state and params['random_state'].
             Default is None
 
         Warnings
@@ -426,81 +510,182 @@ class cluster:
         >>>     c.cluster('parent', 'kmeans', name, k)
 
         
+        """
+        output_name, var_params, seed = self.prepare_clustering(source_name, algorithm, output_name, Require_Unique, random_seed, kwargs)
+        if output_name is None:
+            return
+
+        out, var_params = ca.run_algorithm(self.dataObj.D[source_name], algorithm, var_params, K, 
+            distance_cache=self.dataObj.distance_cache, source_name=source_name)
+        self.store_clustering(output_name, source_name, algorithm, K, seed, out, var_params)
+
+        if self.incremental and self.co_occurrence_current(exclude=[output_name]):
+            self.add_co_occurrence([output_name])
+
+    def cluster_batch(self, jobs, Require_Unique=False, n_jobs=1, backend='process'):
+        """
+        Run many clusterings, as cluster() would one after another, in a pool of processes or threads. The random seeds 
+        and output names of all jobs are set first, in the order of jobs, and the solutions are added in the same order, 
+        so the result does not depend on n_jobs, the backend, or the order the jobs finish in.
+
+        Parameters
+        ----------
+        jobs: list of tuples
+            (source_name, algorithm, output_name, K, kwargs, seed) for each clustering, with the arguments of cluster().
+            kwargs is a dict of the variable parameters (or None), and seed is the random_seed
+        Require_Unique: bool
+            As in cluster(), applied to every job. Names are also made unique among the jobs. Default False
+        n_jobs: int
+            Number of processes or threads. -1 uses all cores. Default 1, which runs the jobs in this process
+        backend: string {'process', 'thread'}
+            Run the jobs in a pool of processes, which are sent the data sources once each, or of threads, which share 
+            them. Threads suit algorithms that release the GIL. Default 'process'
+
+        Returns
+        -------
+        names: list of strings
+            The output names the solutions were added under, in the order of jobs, or None for a job that was not added 
+            because its name was taken and Require_Unique is True
+
+        Raises
+        ------
+            ValueError
+                if a data source or algorithm of any job is not available, before any clustering is run, or if the
+                backend is not recognized
+
+        Examples
+        --------
+        Build an ensemble of 100 kmeans solutions on 4 processes
+
+        >>> jobs = [('parent', 'kmeans', 'kmeans_%d'%(i), 4, {}, i) for i in range(100)]
+        >>> c.cluster_batch(jobs, n_jobs=4)
+
+        """
+        if backend not in ['process', 'thread']:
+            raise ValueError("ERROR: backend %s not recognized, use one of process/thread"%(backend))
+        staged = []
+        taken = set()
+        for source_name, algorithm, output_name, K, kwargs, seed in jobs:
+            output_name, var_params, seed = self.prepare_clustering(source_name, algorithm, output_name, Require_Unique, 
+                seed, dict(kwargs) if kwargs else {}, taken=taken)
+            if output_name is not None:
+                taken.add(output_name)
+            staged.append((source_name, algorithm, output_name, K, var_params, seed))
+        work = [(source_name, algorithm, var_params, K) for source_name, algorithm, output_name, K, var_params, seed 
+            in staged if output_name is not None]
+
+        def run(job):
+            return ca.run_algorithm(self.dataObj.D[job[0]], *job[1:], distance_cache=self.dataObj.distance_cache, source_name=job[0])
+
+        n_jobs = co.num_jobs(n_jobs)
+        if n_jobs == 1 or len(work) < 2:
+            results = [run(job) for job in work]
+        elif backend == 'thread':
+            with ThreadPoolExecutor(max_workers=min(n_jobs, len(work))) as pool:
+                results = list(pool.map(run, work))
+        else:
+            #each process keeps its own cache of distance matrices, with the same cap as that of the data object
+            with ProcessPoolExecutor(max_workers=min(n_jobs, len(work)), initializer=ca.init_worker, 
+                initargs=(self.dataObj.D, self.dataObj.distance_cache.max_bytes)) as pool:
+                results = list(pool.map(ca.run_job, work))
+
+        results = iter(results)
+        names = []
+        for source_name, algorithm, output_name, K, var_params, seed in staged:
+            names.append(output_name)
+            if output_name is None:
+                continue
+            out, var_params = next(results)
+            self.store_clustering(output_name, source_name, algorithm, K, seed, out, var_params)
+
+        added = [name for name in names if name is not None]
+        if added and self.incremental and self.co_occurrence_current(exclude=added):
+            self.add_co_occurrence(added)
+        return names
+
+    def prepare_clustering(self, source_name, algorithm, output_name, Require_Unique, random_seed, var_params, taken=()):
+        """
+        Check a clustering request and set its random seed and output name, as the first step of cluster()
+
+        Returns
+        -------
+        output_name: string
+            The unique name to store the solution under, or None if the name is taken and Require_Unique is True
+        var_params: dict
+            The variable parameters, with the random seed
+        seed: int, numpy.random.SeedSequence or tuple
+            The compact seed of the generator of this clustering: random_seed, or a new SeedSequence (its entropy and
+            spawn key) if random_seed is None
         """
         #CHECK that the source exists
         if source_name not in self.dataObj.D:
             raise ValueError("ERROR: the source you requested for clustering does not exist by that name %s"%(source_name))
         ALG_FCN_DICT = self.algorithms_available()
-        paramDict = {}
 
-        if not kwargs:
-            var_params = {} 
+        #Here if handle if random seed was passed, set it. Else, store the random seed. Only the seed is kept, the 
+        #generator of every clustering is regenerated from it (see clustering_algorithms.random_generator), so numpy's 
+        #global state is neither read nor changed
+        if random_seed is None:
+            seed = random.SeedSequence()
         else:
-            var_params = kwargs
+            seed = random_seed
+        ca.random_generator(seed) #fail on a seed that cannot be used before clustering
 
-        #Here if handle if random seed was passed, set it. Else, store the random seed.
-        if 'random_seed':
-            try:
-                random.set_state(random_seed)
-                state = random_seed
-
-
-            except TypeError:
-                random.seed(random_seed)
-                state = random.get_state()
-
-        var_params['random_state'] = state
+        var_params['random_state'] = seed
 
         ##### Check to see if the same name exists for clustering solution name and decide what to do according to Require_Unique
-        if output_name in list(self.labels.keys()):
+        if output_name in self.labels or output_name in taken:
             if Require_Unique:
                 warnings.warn('The name of the clustering solution is redundant and you required unique, solution will not be added')
-                return
+                return None, var_params, seed
             else:
                 test_name = "%s_%d"%(output_name, randint(0,10000))
-                while test_name in self.labels:
+                while test_name in self.labels or test_name in taken:
                     test_name = "%s_%d"%(output_name, randint(0,10000))
                 output_name = test_name
                 warnings.warn('For uniqueness, altered output_name to be %s'%(output_name), UserWarning)
 
-        ######BEGIN CLUSTERING BLOCK  ######
         if algorithm not in ALG_FCN_DICT:
             raise ValueError( "The algorithm you requested does not exist, currently the following are supported %s"%(list(ALG_FCN_DICT.keys())))
+        return output_name, var_params, seed
 
-
-        random.set_state(state)
-        c = ca.clustering_algorithms(self.dataObj.D[source_name], var_params, K)
-        func = getattr(c,algorithm)
-        func()
- 
-        #### FINAL staging, c now contains a finished assignment and c.params has final parameters used.
-
+    def store_clustering(self, output_name, source_name, algorithm, K, seed, out, var_params):
+        """
+        Add a finished clustering (out, with the final parameters var_params) under output_name, as the last step of
+        cluster()
+        """
         # CHECK that K is as requested 
-        uniqueClusters = np.unique(c.out)
+        uniqueClusters = np.unique(out)
         if K: #check if K was overwritten
-            c.var_params['K'] = K
+            var_params['K'] = K
             if len(uniqueClusters) != K:
                 warnings.warn("Number of unique clusters %d returned does not match number requested %d for solution: %s"%(len(uniqueClusters), K, output_name), UserWarning)
         else:
-            c.var_params['K'] = len(uniqueClusters)
-
+            var_params['K'] = len(uniqueClusters)
 
-        self.labels[output_name] = c.out
+        self.labels[output_name] = out
         self.data_source[output_name] = source_name
-        self.params[output_name] = c.var_params
+        self.params[output_name] = var_params
         self.clusterNumbers[output_name] = uniqueClusters
         self.algorithms[output_name] = algorithm
-        self.random_state[output_name] = state
+        self.random_state[output_name] = seed
 
-
-
-    def co_occurrence_matrix(self, data_source_name='parent'):
+    def co_occurrence_matrix(self, data_source_name='parent', sparse=False, memmap_file=None, use_cache=True, n_jobs=1):
         """
-        Calculate the co-occurrence of all pairs of objects across the ensemble 
+        Calculate the co-occurrence of all pairs of objects across the ensemble. The co-occurrence matrix is cached (see 
+        co_cache) and returned again as long as the names and labels of the solutions in the ensemble are unchanged.
 
         Parameters:
         data_source_name: string
             Name of the data source to link to co-occurrence object. Default is 'parent'
+        sparse: bool
+            If True, store only the non-zero co-occurrences in a scipy.sparse.csr_matrix. Default False
+        memmap_file: string
+            If given, store the co-occurrence as tiles in a memory-mapped file at this path (see cooccurrence.tiled_matrix). Default None
+        use_cache: bool
+            If False, always calculate a new co-occurrence matrix and leave the cache untouched. Default True
+        n_jobs: int
+            Number of processes that count the co-occurrence in parallel (see cooccurrence.coMat). -1 uses all cores. Default 1
 
         Returns
         -------
@@ -514,9 +699,106 @@ class cluster:
         >>> coMat.plot()
 
       """
-        coMat = co.coMat(self, data_source_name)
+        if use_cache:
+            key = (cache.labels_key(self.labels), data_source_name, sparse, memmap_file)
+            coMat = self.co_cache.get(key)
+            if coMat is not None:
+                return coMat
+        counts = None
+        if self.incremental:
+            if not self.co_occurrence_current():
+                self.reset_co_occurrence()
+            counts = self.co_counts
+        if use_cache and memmap_file:
+            #a new matrix overwrites the file of any cached matrix at the same path
+            for cached in list(self.co_cache.entries):
+                if cached[3] == memmap_file:
+                    self.co_cache.remove(cached)
+        coMat = co.coMat(self, data_source_name, sparse=sparse, counts=counts, memmap_file=memmap_file, n_jobs=n_jobs)
+        if use_cache:
+            #co_matrix is kept on the object once read, so its size is measured whenever the cache evicts
+            self.co_cache.put(key, coMat, lambda: coMat.nbytes)
         return coMat
 
+    def clear_co_occurrence_cache(self):
+        """
+        Remove all cached co-occurrence matrices (see co_cache), for instance to release their memory. Entries are 
+        also evicted, least recently used first, when the cache grows beyond co_cache_bytes.
+        """
+        self.co_cache.clear()
+
+    def co_occurrence_current(self, exclude=[]):
+        """
+        Check whether the running co-occurrence counts (co_counts) cover exactly the solutions in labels, by name and 
+        by label contents
+
+        Parameters
+        ----------
+        exclude: list of strings
+            Names of solutions in labels to leave out of the check, such as a solution that is about to be added
+
+        Returns
+        -------
+        current: bool
+            True if co_counts is up to date with labels
+        """
+        if self.co_counts is None:
+            return False
+        names = [name for name in self.labels if name not in exclude]
+        if len(names) != len(self.co_solutions):
+            return False
+        for name in names:
+            if name not in self.co_solutions or not np.array_equal(self.co_solutions[name], self.labels[name]):
+                return False
+        return True
+
+    def add_co_occurrence(self, names):
+        """
+        Add the co-occurrence counts of the solutions in names to the running counts (co_counts)
+
+        Parameters
+        ----------
+        names: list of strings
+            Names of solutions in labels
+        """
+        N = self.dataObj.D['parent'].shape[0]
+        parg = [self.labels[name] for name in names]
+        if not self.sparse_counts:
+            self.co_counts = co.update_counts(self.co_counts, parg, N, len(self.co_solutions)+len(names))
+        elif self.co_counts is None:
+            self.co_counts = co.co_occurrence_counts(parg, N)
+        else:
+            self.co_counts = self.co_counts + co.co_occurrence_counts(parg, N)
+        for name in names:
+            self.co_solutions[name] = np.array(self.labels[name])
+
+    def remove_co_occurrence(self, names):
+        """
+        Subtract the co-occurrence counts of the solutions in names from the running counts (co_counts)
+
+        Parameters
+        ----------
+        names: list of strings
+            Names of solutions counted in co_counts
+        """
+        N = self.dataObj.D['parent'].shape[0]
+        parg = [self.co_solutions[name] for name in names]
+        if self.sparse_counts:
+            self.co_counts = self.co_counts - co.co_occurrence_counts(parg, N)
+            self.co_counts.eliminate_zeros()
+        else:
+            self.co_counts = co.update_counts(self.co_counts, parg, N, len(self.co_solutions)-len(names), subtract=True)
+        for name in names:
+            del self.co_solutions[name]
+
+    def reset_co_occurrence(self):
+        """
+        Recount the running co-occurrence counts (co_counts) from every solution in labels
+        """
+        self.co_counts = None
+        self.co_solutions = {}
+        self.add_co_occurrence(list(self.labels.keys()))
+
     def MI(self, MI_type='standard'):
         """
         Calculate the mutual information between all pairs of clustering solutions
@@ -541,7 +823,7 @@ class cluster:
         return MI
 
 
-    def mixture_model(self, K=2, iterations=10):
+    def mixture_model(self, K=2, iterations=10, tol=None, n_init=1, random_state=None, n_jobs=1, batch_size=None):
         """
         Finishing Technique to assemble a final, hard parition of the data according to maximizing the likelihood according to the
         observed clustering solutions across the ensemble. This will operate on all clustering solutions contained in the container cluster class.
@@ -553,7 +835,18 @@ class cluster:
         K: int
             number of clusters to create. Default K=2
         iterations: int
-            number of iterations of EM algorithm to perform. Default iterations=10
+            number of iterations of EM algorithm to perform, or the most iterations if tol is set. Default iterations=10
+        tol: float
+            If set, stop once an iteration improves the log-likelihood by less than tol. Default None
+        n_init: int
+            Number of random restarts, of which the one with the highest log-likelihood is kept. Default 1
+        random_state: int
+            Seed of the random restarts. Default None
+        n_jobs: int
+            Number of processes that run restarts in parallel. -1 uses all cores. Default 1
+        batch_size: int
+            If set, run mini-batch EM over batches of batch_size objects, for very large numbers of objects. Each 
+            iteration is then one pass over all batches (see finishing.mixture_model). Default None
        
         Returns
         -------
@@ -578,6 +871,10 @@ class cluster:
         params = {}
         params['iterations'] = iterations
         params['K'] = K
+        params['tol'] = tol
+        params['n_init'] = n_init
+        params['random_state'] = random_state
+        params['batch_size'] = batch_size
 
         #check to make sure more than one solution exists in ensemble
         if len(self.params) < 2:
@@ -587,7 +884,8 @@ class cluster:
         for solution in self.labels:
             parg.append(self.labels[solution])
 
-        mixtureObj = finish.mixture_model(parg, N, nEnsCluster=K, iterations=iterations)
+        mixtureObj = finish.mixture_model(parg, N, nEnsCluster=K, iterations=iterations, tol=tol, n_init=n_init, 
+            random_state=random_state, n_jobs=n_jobs, batch_size=batch_size)
         mixtureObj.emProcess()
         c = oe.cluster(self.dataObj)
         name = 'mixture_model'
@@ -598,7 +896,7 @@ class cluster:
         c.algorithms[name] = 'mixture_model'
         return c
 
-    def finish_co_occ_linkage(self, threshold, linkage='average'):
+    def finish_co_occ_linkage(self, threshold, linkage='average', sparse=False, memmap_file=None, n_jobs=1):
         """
         The finishing technique that calculates a co-occurrence matrix on all cluster solutions in the ensemble and 
         then hierarchically clusters the co-occurrence, treating it as a similarity matrix. The clusters are defined by 
@@ -608,10 +906,18 @@ class cluster:
 
         Parameters
         ----------
-        threshold: float
-            Linkage distance to use as a cutoff to create partitions
+        threshold: float or 'auto'
+            Linkage distance to use as a cutoff to create partitions. 'auto' cuts in the middle of the largest gap between
+            consecutive merge distances (the maximal lifetime criterion, see coMat.lifetime_threshold), which is then 
+            stored in c.params['co_occ_linkage']['lifetime_threshold']
         linkage: string
             Linkage type. See `scipy.cluster.hierarchy <https://docs.scipy.org/doc/scipy/reference/generated/scipy.cluster.hierarchy.linkage.html#scipy.cluster.hierarchy.linkage>`_
+        sparse: bool
+            If True, use a sparse co-occurrence matrix. Default False
+        memmap_file: string
+            If given, use a co-occurrence matrix memory-mapped to this file. Default None
+        n_jobs: int
+            Number of processes that count the co-occurrence matrix in parallel. -1 uses all cores. Default 1
 
         Returns
         -------
@@ -630,14 +936,21 @@ class cluster:
         >>> cWard = c.co_occ_linkage(0.5, 'ward')
         >>> d.plot_data('parent', cluster_labels=cWard.labels['co_occ_linkage'])
 
+        To cut at the maximal lifetime threshold
+
+        >>> cAuto = c.finish_co_occ_linkage('auto')
+        >>> cAuto.params['co_occ_linkage']['lifetime_threshold']
+
 
         """
         params={}
         params['linkage'] = linkage
         params['threshold'] = threshold
-        coMatObj = self.co_occurrence_matrix('parent')
+        coMatObj = self.co_occurrence_matrix('parent', sparse=sparse, memmap_file=memmap_file, n_jobs=n_jobs)
         coL = finish.co_occurrence_linkage(coMatObj, threshold, linkage=linkage)
         coL.finish()
+        if threshold == 'auto':
+            params['lifetime_threshold'] = coL.threshold
         c = oe.cluster(self.dataObj)
         name = 'co_occ_linkage'
         c.labels[name] = coL.labels
@@ -647,13 +960,147 @@ class cluster:
         c.algorithms[name] = 'co_occ_linkage'
         return c
 
-    def finish_graph_closure(self, threshold, clique_size = 3):
+    def finish_co_occ_linkage_sweep(self, thresholds=None, n_clusters=None, linkage='average', sparse=False, memmap_file=None, n_jobs=1):
+        """
+        Sweep finish_co_occ_linkage over many thresholds, or numbers of clusters, for model selection. The
+        co-occurrence matrix and its linkage are calculated once and then cut once per threshold. Give either
+        thresholds or n_clusters.
+
+        Parameters
+        ----------
+        thresholds: list of floats
+            Linkage distances to use as cutoffs. Default None
+        n_clusters: list of ints
+            Largest numbers of clusters to cut the linkage into. Default None
+        linkage: string
+            Linkage type. See `scipy.cluster.hierarchy <https://docs.scipy.org/doc/scipy/reference/generated/scipy.cluster.hierarchy.linkage.html#scipy.cluster.hierarchy.linkage>`_
+        sparse: bool
+            If True, use a sparse co-occurrence matrix. Default False
+        memmap_file: string
+            If given, use a co-occurrence matrix memory-mapped to this file. Default None
+        n_jobs: int
+            Number of processes that count the co-occurrence matrix in parallel. -1 uses all cores. Default 1
+
+        Returns
+        -------
+        c: openensembles clustering object
+            a new clustering object with one solution per cut, c.labels['co_occ_linkage_i'] for the i-th threshold
+            (or number of clusters). c.params of each solution holds its threshold (or n_clusters) and K
+        labels: matrix of ints
+            The same solutions as a matrix, one row per cut
+        K: array of ints
+            The number of clusters of every cut
+
+        See also
+        --------
+        finishing.co_occurrence_linkage.sweep
+
+        Examples
+        --------
+        Plot the number of clusters against the threshold
+
+        >>> thresholds = np.linspace(0.05, 0.95, 19)
+        >>> cSweep, labels, K = c.finish_co_occ_linkage_sweep(thresholds, linkage='average')
+        >>> plt.step(thresholds, K)
+
+        """
+        coMatObj = self.co_occurrence_matrix('parent', sparse=sparse, memmap_file=memmap_file, n_jobs=n_jobs)
+        coL = finish.co_occurrence_linkage(coMatObj, None, linkage=linkage)
+        labels, K = coL.sweep(thresholds=thresholds, n_clusters=n_clusters)
+        if thresholds is not None:
+            key, values = 'threshold', np.atleast_1d(thresholds)
+        else:
+            key, values = 'n_clusters', np.atleast_1d(n_clusters)
+        c = oe.cluster(self.dataObj)
+        for i in range(labels.shape[0]):
+            params = {}
+            params['linkage'] = linkage
+            params[key] = values[i]
+            params['K'] = K[i]
+            name = 'co_occ_linkage_%d'%(i)
+            c.labels[name] = labels[i]
+            c.params[name] = params
+            c.data_source[name] = 'parent'
+            c.clusterNumbers[name] = np.unique(c.labels[name])
+            c.algorithms[name] = 'co_occ_linkage'
+        return c, labels, K
+
+    def finish_single_link(self, threshold, sparse=False, memmap_file=None, n_jobs=1):
+        """
+        The finishing technique that clusters the co-occurrence matrix by single linkage (evidence accumulation), cut at a
+        distance threshold, where the distance of two objects is 1 - co-occurrence. This gives the same partition as
+        finish_co_occ_linkage(threshold, linkage='single'), but from the minimum spanning forest of the sparse graph of 
+        pairs within the threshold, so that no condensed distance matrix or dense linkage is calculated. Combine with 
+        sparse or memmap_file for ensembles of many objects.
+
+        Parameters
+        ----------
+        threshold: float
+            Linkage distance to use as a cutoff to create partitions
+        sparse: bool
+            If True, use a sparse co-occurrence matrix. Default False
+        memmap_file: string
+            If given, use a co-occurrence matrix memory-mapped to this file. Default None
+        n_jobs: int
+            Number of processes that count the co-occurrence matrix in parallel. -1 uses all cores. Default 1
+
+        Returns
+        -------
+        c: openensembles clustering object
+            a new clustering object with c.labels['single_link'] set to the final solution. 
+
+        See also
+        --------
+        finishing.single_link_mst
+
+        Examples
+        --------
+        >>> cSingle = c.finish_single_link(0.5, sparse=True)
+        >>> d.plot_data('parent', cluster_labels=cSingle.labels['single_link'])
+
+        """
+        params = {}
+        params['threshold'] = threshold
+        coMatObj = self.co_occurrence_matrix('parent', sparse=sparse, memmap_file=memmap_file, n_jobs=n_jobs)
+        c_SL = finish.single_link_mst(coMatObj, threshold)
+        c_SL.finish()
+        c = oe.cluster(self.dataObj)
+        name = 'single_link'
+        c.labels[name] = c_SL.labels
+        c.params[name] = params
+        c.data_source[name] = 'parent'
+        c.clusterNumbers[name] = np.unique(c.labels[name])
+        c.algorithms[name] = 'single_link'
+        return c
+
+    def finish_graph_closure(self, threshold, clique_size = 3, sparse=False, memmap_file=None, n_jobs=1, engine='clique_graph', 
+            percolation_jobs=1):
         """ 
         The finishing technique that treats the co-occurrence matrix as a graph, that is binarized by the threshold (>=threshold 
         becomes an unweighted, undirected edge in an adjacency matrix). This graph object is then subjected to clique formation
         according to clique_size (such as triangles if clique_size=3). The cliques are then combined in the graph to create unique
         cluster formations. 
 
+        Parameters
+        ----------
+        threshold: float
+            Co-occurrence fraction at or above which a pair of objects is joined by an edge
+        clique_size: int
+            Size of the cliques to percolate. Default 3
+        sparse: bool
+            If True, use a sparse co-occurrence matrix. Default False
+        memmap_file: string
+            If given, use a co-occurrence matrix memory-mapped to this file. Default None
+        n_jobs: int
+            Number of processes that count the co-occurrence matrix in parallel. -1 uses all cores. Default 1
+        engine: string {'clique_graph', 'stream'}
+            How cliques are percolated (see finishing.graph_closure). 'stream' percolates one connected component at a 
+            time in less memory, but can label objects shared by overlapping percolated cliques differently from 
+            'clique_graph'. Default 'clique_graph'
+        percolation_jobs: int
+            With engine='stream', the number of processes that percolate the cliques of the connected components of the 
+            graph in parallel. The labels are the same for any number. -1 uses all cores. Default 1
+
         See also
         --------
         finishing.py 
@@ -672,9 +1119,10 @@ class cluster:
         params = {}
         params['threshold'] = threshold
         params['clique_size'] = clique_size
-        coMatObj = self.co_occurrence_matrix('parent')
+        params['engine'] = engine
+        coMatObj = self.co_occurrence_matrix('parent', sparse=sparse, memmap_file=memmap_file, n_jobs=n_jobs)
 
-        c_G = finish.graph_closure(coMatObj.co_matrix, threshold, clique_size=clique_size)
+        c_G = finish.graph_closure(coMatObj, threshold, clique_size=clique_size, engine=engine, n_jobs=percolation_jobs)
         c_G.finish()
         c = oe.cluster(self.dataObj)
         name = 'graph_closure'
@@ -685,7 +1133,7 @@ class cluster:
         c.algorithms[name] = 'graph_closure'
         return c
 
-    def finish_majority_vote(self, threshold=0.5):
+    def finish_majority_vote(self, threshold=0.5, sparse=False, memmap_file=None, n_jobs=1, signatures=False):
         """
 
         Based on Ana Fred's 2001 paper: Fred, Ana. Finding Consistent Clusters in Data Partitions. In Multiple Classifier Systems, 
@@ -698,6 +1146,16 @@ class cluster:
         ----------
         threshold: float
             the threshold, or fraction of times objects co-cluster to consider a 'majority'. Default is 0.5 (50% of the time)
+        sparse: bool
+            If True, use a sparse co-occurrence matrix. Default False
+        memmap_file: string
+            If given, use a co-occurrence matrix memory-mapped to this file. Default None
+        n_jobs: int
+            Number of processes that count the co-occurrence matrix in parallel. -1 uses all cores. Default 1
+        signatures: bool
+            If True, vote between groups of objects with identical labels across the ensemble, comparing their labels
+            directly instead of building a co-occurrence matrix (see finishing.signature_majority_vote). The labels are
+            the same, at a cost that scales with the number of distinct label signatures. Default False
 
         Returns
         -------
@@ -710,8 +1168,12 @@ class cluster:
         >>> labels = c_MV.labels['majority_vote']
         """
         params = {}
-        coMatObj = self.co_occurrence_matrix('parent')
-        c_MV = finish.majority_vote(coMatObj.co_matrix, threshold)
+        if signatures:
+            N = self.dataObj.D['parent'].shape[0]
+            c_MV = finish.signature_majority_vote(list(self.labels.values()), N, threshold)
+        else:
+            coMatObj = self.co_occurrence_matrix('parent', sparse=sparse, memmap_file=memmap_file, n_jobs=n_jobs)
+            c_MV = finish.majority_vote(coMatObj, threshold)
         c_MV.finish()
 
         c = oe.cluster(self.dataObj)
@@ -723,6 +1185,108 @@ class cluster:
         c.algorithms[name] = 'majority_vote'
         return c
 
+    def finish_alignment_vote(self, reference=None, iterations=10):
+        """
+        The finishing technique that relabels every solution to match a reference solution, pairing clusters one to one
+        by the Hungarian algorithm on their contingency table, and assigns each object the label given to it by the most
+        solutions. The vote is then used as the reference of the next round, until it stops changing. No co-occurrence
+        matrix is built and the cost is linear in the number of objects, which suits ensembles of solutions with the
+        same number of clusters, such as kmeans with a fixed K.
+
+        Parameters
+        ----------
+        reference: string
+            Name of the solution in self.labels to align to in the first round. Default None, the first solution
+        iterations: int
+            Largest number of rounds of alignment and voting. Default 10
+
+        Returns
+        -------
+        c: openensembles cluster object
+            New cluster object with final solution and name 'alignment_vote'
+
+        Raises
+        ------
+        ValueError:
+            If reference is not the name of a solution
+
+        See also
+        --------
+        finishing.alignment_vote
+
+        Examples
+        --------
+        >>> c_AV = c.finish_alignment_vote()
+        >>> labels = c_AV.labels['alignment_vote']
+        """
+        params = {}
+        params['reference'] = reference
+        params['iterations'] = iterations
+        names = list(self.labels.keys())
+        if reference is None:
+            index = 0
+        elif reference in self.labels:
+            index = names.index(reference)
+        else:
+            raise ValueError("ERROR: the reference solution %s is not in the ensemble"%(reference))
+        N = self.dataObj.D['parent'].shape[0]
+        c_AV = finish.alignment_vote([self.labels[name] for name in names], N, reference=index, iterations=iterations)
+        c_AV.finish()
+
+        c = oe.cluster(self.dataObj)
+        name = 'alignment_vote'
+        c.labels[name] = c_AV.labels
+        c.params[name] = params
+        c.data_source[name] = 'parent'
+        c.clusterNumbers[name] = np.unique(c.labels[name])
+        c.algorithms[name] = 'alignment_vote'
+        return c
+
+    def finish_mcla(self, K=None, linkage='average'):
+        """
+        The Meta-CLustering Algorithm (MCLA) of Strehl and Ghosh, 2002. The clusters of all solutions are clustered by
+        their Jaccard similarity into K meta-clusters, and each object is assigned to the meta-cluster that holds the
+        largest share of the clusters it belongs to. This works on the sparse indicator matrix of the ensemble, without
+        a co-occurrence matrix, so the cost is linear in the number of objects.
+
+        Parameters
+        ----------
+        K: int
+            Number of meta-clusters, an upper bound on the number of final clusters. Default None, the median number of
+            clusters of the solutions in the ensemble
+        linkage: string
+            Linkage used to cluster the clusters. Default 'average'
+
+        Returns
+        -------
+        c: openensembles cluster object
+            New cluster object with final solution and name 'mcla'
+
+        See also
+        --------
+        finishing.mcla
+
+        Examples
+        --------
+        >>> c_MCLA = c.finish_mcla(K=3)
+        >>> labels = c_MCLA.labels['mcla']
+        """
+        params = {}
+        params['K'] = K
+        params['linkage'] = linkage
+        N = self.dataObj.D['parent'].shape[0]
+        c_MCLA = finish.mcla(list(self.labels.values()), N, K=K, linkage=linkage)
+        c_MCLA.finish()
+
+        c = oe.cluster(self.dataObj)
+        name = 'mcla'
+        c.labels[name] = c_MCLA.labels
+        c.params[name] = params
+        c.data_source[name] = 'parent'
+        c.clusterNumbers[name] = np.unique(c.labels[name])
+        c.algorithms[name] = 'mcla'
+        return c
+
 
     def get_cluster_members(self, solution_name, clusterNum):
         """ Return the dataframe row indexes of a cluster number in solution named by solution_name 
@@ -857,7 +1421,7 @@ class cluster:
 
 
         """
-        c = oe.cluster(self.dataObj)
+        c = oe.cluster(self.dataObj, incremental=self.incremental, sparse_counts=self.sparse_counts)
         names_existing = list(self.labels.keys())
         for name in names:
             if name not in names_existing:
@@ -867,6 +1431,15 @@ class cluster:
             c.params[name] = self.params[name]
             c.clusterNumbers[name] = self.clusterNumbers[name]
             c.algorithms[name] = self.algorithms[name]
+
+        #subtract the removed solutions from the running counts, unless recounting the kept solutions is cheaper
+        removed = [name for name in names_existing if name not in c.labels]
+        if self.incremental and self.co_occurrence_current() and len(removed) < len(c.labels):
+            #dense counts are updated in place
+            c.co_counts = self.co_counts if self.sparse_counts else self.co_counts.copy()
+            c.co_solutions = dict(self.co_solutions)
+            if removed:
+                c.remove_co_occurrence(removed)
         return c
 
 
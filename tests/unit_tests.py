@@ -19,13 +19,19 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
 import os.path
+import pickle
+import tempfile
 import time
 import unittest
 import random
+import numpy as np
 import pandas as pd
+import scipy.sparse as sps
 
 import openensembles as oe
 import openensembles.clustering_algorithms as ca
+import openensembles.cooccurrence as co
+import openensembles.finishing as finish
 
 class TestFunctions(unittest.TestCase):
 
@@ -35,6 +41,14 @@ class TestFunctions(unittest.TestCase):
         x = [0, 5, 30]
         self.data = oe.data(df, x)
 
+    def three_solutions(self):
+        """ A cluster object of three solutions set directly, in which objects 0 and 1 co-cluster 2 times out of 3 """
+        c = oe.cluster(self.data)
+        c.labels['a'] = np.array([0, 0, 1])
+        c.labels['b'] = np.array([1, 0, 0])
+        c.labels['c'] = np.array([0, 0, 2])
+        return c
+
     def test_correct_setup(self):
         self.assertEqual((3,3), self.data.D['parent'].shape)
         self.assertEqual(3, len(self.data.x['parent']))
@@ -160,6 +174,40 @@ class TestFunctions(unittest.TestCase):
 
 
 
+    def test_distance_cache(self):
+        d = self.data.distance_matrix('parent')
+        self.assertTrue(np.allclose(ca.returnDistanceMatrix(self.data.D['parent'], 'euclidean'), d))
+        self.assertIs(d, self.data.distance_matrix('parent', 'euclidean'))
+        self.assertFalse(d.flags.writeable)
+        self.assertIsNot(d, self.data.distance_matrix('parent', 'cityblock'))
+        self.assertEqual(2*d.nbytes, self.data.distance_cache.nbytes)
+
+        #the algorithms that cluster distance matrices read the cache of the data object
+        c = oe.cluster(self.data)
+        c.cluster('parent', 'DBSCAN', 'DBSCAN', eps=10)
+        c.cluster('parent', 'Birch', 'Birch', K=2, copy=False)
+        self.assertEqual(2, len(self.data.distance_cache))
+
+        #a replaced data source is not served from the cache, and a full cache evicts the oldest matrix
+        self.data.D['parent'] = self.data.D['parent'] + 1
+        self.assertIsNot(d, self.data.distance_matrix('parent'))
+        small = oe.data(self.data.df, [0, 5, 30], distance_cache_bytes=d.nbytes)
+        small.distance_matrix('parent')
+        small.distance_matrix('parent', 'cityblock')
+        self.assertEqual([('parent', 'cityblock')], list(small.distance_cache.entries.keys()))
+        self.assertRaises(ValueError, small.distance_matrix, 'parentZ')
+
+    def test_data_unpickle_legacy(self):
+        #data objects pickled before the distance cache existed lack it
+        del self.data.distance_cache
+        dOld = pickle.loads(pickle.dumps(self.data))
+        d = dOld.distance_matrix('parent')
+        self.assertIs(d, dOld.distance_matrix('parent'))
+        c = oe.cluster(dOld)
+        c.cluster('parent', 'DBSCAN', 'DBSCAN', eps=10)
+        c.cluster_batch([('parent', 'kmeans', 'kmeans', 2, None, 0)], n_jobs=2)
+        self.assertEqual(2, len(c.labels))
+
     def test_clustering_NoSource(self):
         c = oe.cluster(self.data)
         self.assertRaises(ValueError, lambda: c.cluster('parentZ', 'kmeans', 'bad'))
@@ -176,6 +224,57 @@ class TestFunctions(unittest.TestCase):
         c.cluster('parent', 'kmeans', 'kmeans', Require_Unique=1, K=2)
         self.assertEqual(1, len(c.labels))
 
+    def test_cluster_batch(self):
+        c = oe.cluster(self.data)
+        for i in range(4):
+            c.cluster('parent', 'kmeans', 'kmeans_%d'%(i), K=2, random_seed=i, n_init=1, init='random')
+        jobs = [('parent', 'kmeans', 'kmeans_%d'%(i), 2, {'n_init':1, 'init':'random'}, i) for i in range(4)]
+        for n_jobs in [1, 2]:
+            cBatch = oe.cluster(self.data)
+            self.assertEqual(['kmeans_0', 'kmeans_1', 'kmeans_2', 'kmeans_3'], cBatch.cluster_batch(jobs, n_jobs=n_jobs))
+            self.assertListEqual(list(c.labels.keys()), list(cBatch.labels.keys()))
+            for name in c.labels:
+                self.assertListEqual(list(c.labels[name]), list(cBatch.labels[name]))
+                self.assertEqual(c.random_state[name], cBatch.random_state[name])
+                self.assertEqual(2, cBatch.params[name]['K'])
+        #repeated names are made unique within the batch, or skipped when Require_Unique
+        self.assertIsNone(cBatch.cluster_batch(jobs[:1], Require_Unique=True)[0])
+        self.assertRaises(ValueError, cBatch.cluster_batch, [('parentZ', 'kmeans', 'bad', 2, None, 0)])
+        self.assertEqual(4, len(cBatch.labels))
+        names = oe.cluster(self.data).cluster_batch([jobs[0], jobs[0]])
+        self.assertEqual('kmeans_0', names[0])
+        self.assertNotEqual(names[0], names[1])
+
+    def test_cluster_random_state(self):
+        c = oe.cluster(self.data)
+        np.random.seed(0)
+        state = np.random.get_state()
+        c.cluster('parent', 'kmeans', 'kmeans', K=2, random_seed=5)
+        c.cluster('parent', 'kmeans', 'kmeans_none', K=2)
+        #the global random state is left alone, and an int seed keeps its legacy state
+        self.assertTrue(np.array_equal(state[1], np.random.get_state()[1]))
+        self.assertEqual(np.random.RandomState(5).get_state()[1][0], ca.algorithm_seed(c.params['kmeans']['random_state']))
+        c.cluster('parent', 'kmeans', 'kmeans_again', K=2, random_seed=c.random_state['kmeans_none'])
+        self.assertListEqual(list(c.labels['kmeans_none']), list(c.labels['kmeans_again']))
+
+        #only compact seeds are stored, and the generator is regenerated from them
+        self.assertEqual(5, c.random_state['kmeans'])
+        self.assertIsInstance(c.random_state['kmeans_none'], np.random.SeedSequence)
+        generator = ca.random_generator(c.random_state['kmeans_none'])
+        self.assertTrue(np.array_equal(generator.get_state()[1], ca.random_generator(c.random_state['kmeans_again']).get_state()[1]))
+        state = np.random.RandomState(7).get_state()
+        self.assertEqual(state[1][0], ca.algorithm_seed(state))
+        self.assertIsNone(ca.algorithm_seed(None))
+
+        jobs = [('parent', 'kmeans', 'kmeans_%d'%(i), 2, {'n_init':1, 'init':'random'}, i) for i in range(4)]
+        cProcess = oe.cluster(self.data)
+        cProcess.cluster_batch(jobs, n_jobs=2)
+        cThread = oe.cluster(self.data)
+        cThread.cluster_batch(jobs, n_jobs=2, backend='thread')
+        for name in cProcess.labels:
+            self.assertListEqual(list(cProcess.labels[name]), list(cThread.labels[name]))
+        self.assertRaises(ValueError, cThread.cluster_batch, jobs, backend='gobblygook')
+
     def test_cluster_slice(self):
         c = oe.cluster(self.data)
         c.cluster('parent', 'kmeans', 'kmeans_0', K=2)
@@ -193,6 +292,402 @@ class TestFunctions(unittest.TestCase):
         names = ['kmeans_2', 'gooblygook']
         self.assertRaises(ValueError, lambda: c.slice(names))
 
+    def test_co_occurrence_engines(self):
+        c = oe.cluster(self.data)
+        c.labels['a'] = np.array([0, 0, 1])
+        c.labels['b'] = np.array([1, 0, 0])
+        c.labels['c'] = np.array([2, 2, 2])
+        coMat_loop = co.coMat(c, 'parent', engine='loop')
+        coMat_ind = co.coMat(c, 'parent', engine='indicator')
+        self.assertTrue(np.array_equal(coMat_loop.co_matrix.values, coMat_ind.co_matrix.values))
+        self.assertAlmostEqual(2.0/3, coMat_ind.co_matrix.values[0,1])
+        self.assertAlmostEqual(1.0/3, coMat_ind.co_matrix.values[0,2])
+        self.assertRaises(ValueError, lambda: co.coMat(c, 'parent', engine='gobblygook'))
+
+    def test_co_occurrence_counts(self):
+        c = self.three_solutions()
+        coMat = c.co_occurrence_matrix()
+        self.assertEqual(np.uint8, coMat.counts.dtype)
+        self.assertEqual(3, coMat.counts[0,0])
+        self.assertEqual(np.float32, coMat.fractions().dtype)
+        self.assertTrue(np.allclose(coMat.co_matrix.values, coMat.fractions()))
+
+        #co_matrix is kept until counts is replaced, and cannot be assigned
+        self.assertIs(coMat.co_matrix, coMat.co_matrix)
+        self.assertEqual(coMat.counts.nbytes + coMat.co_matrix.values.nbytes, coMat.nbytes)
+        coMat.counts = coMat.counts*0
+        self.assertEqual(0, coMat.co_matrix.values.sum())
+        with self.assertRaises(ValueError):
+            coMat.co_matrix = coMat.fractions()
+        self.assertEqual(np.uint8, co.count_dtype(255))
+        self.assertEqual(np.uint16, co.count_dtype(256))
+        self.assertEqual(np.uint32, co.count_dtype(70000))
+
+    def test_co_occurrence_sparse(self):
+        c = self.three_solutions()
+        coMat_dense = c.co_occurrence_matrix()
+        coMat_sparse = c.co_occurrence_matrix(sparse=True)
+        self.assertTrue(np.array_equal(coMat_dense.co_matrix.values, coMat_sparse.co_matrix.toarray()))
+        self.assertAlmostEqual(coMat_dense.avg_dist, coMat_sparse.avg_dist)
+        self.assertEqual(2, len(coMat_sparse.pairwise_list()))
+
+        c_MV = c.finish_majority_vote(threshold=0.5, sparse=True)
+        self.assertListEqual([1, 1, 2], list(c_MV.labels['majority_vote']))
+        c_L = c.finish_co_occ_linkage(0.5, sparse=True)
+        self.assertTrue(np.array_equal(c.finish_co_occ_linkage(0.5).labels['co_occ_linkage'], c_L.labels['co_occ_linkage']))
+        self.assertRaises(ValueError, lambda: co.coMat(c, 'parent', engine='loop', sparse=True))
+
+    def test_co_occurrence_incremental(self):
+        c = oe.cluster(self.data, incremental=True)
+        c.cluster('parent', 'kmeans', 'kmeans_0', K=2)
+        c.cluster('parent', 'agglomerative', 'agglomerative_0', K=2)
+        c.cluster('parent', 'kmeans', 'kmeans_1', K=2)
+        self.assertTrue(c.co_occurrence_current())
+        self.assertTrue(np.array_equal(co.coMat(c, 'parent').co_matrix.values, c.co_occurrence_matrix().co_matrix.values))
+
+        cNew = c.slice(['kmeans_0', 'kmeans_1'])
+        self.assertTrue(cNew.co_occurrence_current())
+        self.assertTrue(np.array_equal(co.coMat(cNew, 'parent').co_matrix.values, cNew.co_occurrence_matrix().co_matrix.values))
+        self.assertTrue(np.array_equal(co.coMat(c, 'parent').counts, c.co_counts))
+
+        #solutions changed outside of cluster() are recounted
+        c.labels['kmeans_0'] = np.array([0, 1, 2])
+        self.assertFalse(c.co_occurrence_current())
+        self.assertTrue(np.array_equal(co.coMat(c, 'parent').co_matrix.values, c.co_occurrence_matrix().co_matrix.values))
+        c.labels['kmeans_1'][:] = np.array([2, 1, 0])
+        self.assertFalse(c.co_occurrence_current())
+        self.assertTrue(np.array_equal(co.coMat(c, 'parent').counts, c.co_occurrence_matrix().counts))
+        self.assertTrue(c.co_occurrence_current())
+
+        #dense running counts are kept in the smallest unsigned type, and widened as the ensemble grows
+        self.assertEqual(np.uint8, c.co_counts.dtype)
+        cSparse = oe.cluster(self.data, incremental=True, sparse_counts=True)
+        for i in range(256):
+            name = 'solution_%d'%(i)
+            c.labels[name] = cSparse.labels[name] = np.array([0, 0, i%2])
+            c.add_co_occurrence([name])
+            cSparse.add_co_occurrence([name])
+        self.assertEqual(np.uint16, c.co_counts.dtype)
+        self.assertTrue(sps.issparse(cSparse.co_counts))
+        self.assertTrue(np.array_equal(cSparse.co_counts.toarray()[:2,:2], [[256, 256], [256, 256]]))
+        names = ['solution_%d'%(i) for i in range(200)]
+        c.remove_co_occurrence(names)
+        for name in names:
+            del c.labels[name]
+        self.assertTrue(c.co_occurrence_current())
+        self.assertTrue(np.array_equal(co.coMat(c, 'parent').counts, c.co_occurrence_matrix().counts))
+        self.assertEqual(np.uint8, c.co_occurrence_matrix(sparse=True).counts.dtype)
+
+    def test_co_occurrence_memmap(self):
+        c = self.three_solutions()
+        coMat_dense = c.co_occurrence_matrix()
+        memmap_file = os.path.join(tempfile.mkdtemp(), 'co_matrix.dat')
+        coMat_tiled = c.co_occurrence_matrix(memmap_file=memmap_file)
+        self.assertEqual(np.uint8, coMat_tiled.co_matrix.tiles.dtype)
+        self.assertTrue(np.array_equal(coMat_dense.co_matrix.values, coMat_tiled.co_matrix.toarray()))
+        self.assertAlmostEqual(coMat_dense.avg_dist, coMat_tiled.avg_dist)
+        self.assertTrue(np.array_equal(coMat_dense.link(), coMat_tiled.link()))
+
+        coMat_tiled = co.coMat(c, 'parent', memmap_file=memmap_file, tile_size=2)
+        self.assertEqual(2, coMat_tiled.co_matrix.nTiles)
+        self.assertTrue(np.array_equal(coMat_dense.co_matrix.values, coMat_tiled.co_matrix.toarray()))
+        c_MV = c.finish_majority_vote(threshold=0.5, memmap_file=memmap_file)
+        self.assertListEqual([1, 1, 2], list(c_MV.labels['majority_vote']))
+
+    def test_co_occurrence_pairwise_list(self):
+        c = self.three_solutions()
+        coMat = c.co_occurrence_matrix()
+        df = coMat.pairwise_list(block_size=2)
+        self.assertEqual(3, len(df))
+        self.assertListEqual([2/3., 0, 1/3.], list(df['pairwise']))
+        self.assertEqual('%s; %s'%(coMat.header[0], coMat.header[1]), df.index[0])
+
+        df = coMat.pairwise_list(threshold=0.3)
+        self.assertListEqual([2/3., 1/3.], list(df['pairwise']))
+        df = coMat.pairwise_list(top_k=1)
+        self.assertListEqual([2/3.], list(df['pairwise']))
+        memmap_file = os.path.join(tempfile.mkdtemp(), 'co_matrix.dat')
+        coMat_tiled = co.coMat(c, 'parent', memmap_file=memmap_file, tile_size=2)
+        self.assertTrue(df.equals(coMat_tiled.pairwise_list(top_k=1)))
+
+    def test_co_occurrence_parallel(self):
+        c = self.three_solutions()
+        coMat = co.coMat(c, 'parent')
+        coMat_parallel = co.coMat(c, 'parent', n_jobs=2)
+        self.assertTrue(np.array_equal(coMat.counts, coMat_parallel.counts))
+        self.assertTrue(np.array_equal(coMat.counts, coMat_parallel.gather_parallel(block_size=1)))
+        coMat_parallel = co.coMat(c, 'parent', sparse=True, n_jobs=2)
+        self.assertTrue(np.array_equal(coMat.counts, coMat_parallel.counts.toarray()))
+        memmap_file = os.path.join(tempfile.mkdtemp(), 'co_matrix.dat')
+        coMat_parallel = co.coMat(c, 'parent', memmap_file=memmap_file, tile_size=2, n_jobs=2)
+        self.assertTrue(np.array_equal(coMat.co_matrix.values, coMat_parallel.co_matrix.toarray()))
+
+    def test_finish_single_link(self):
+        c = self.three_solutions()
+        for threshold, labels in [(0.2, [1, 2, 3]), (0.5, [1, 1, 2]), (0.7, [1, 1, 1])]:
+            c_SL = c.finish_single_link(threshold)
+            self.assertListEqual(labels, list(c_SL.labels['single_link']))
+            self.assertListEqual(labels, list(c.finish_single_link(threshold, sparse=True).labels['single_link']))
+            c_L = c.finish_co_occ_linkage(threshold, linkage='single')
+            self.assertEqual(len(set(labels)), len(np.unique(c_L.labels['co_occ_linkage'])))
+
+    def test_finish_co_occ_linkage_sweep(self):
+        c = self.three_solutions()
+        thresholds = [0.2, 0.5, 0.7]
+        cSweep, labels, K = c.finish_co_occ_linkage_sweep(thresholds, linkage='single')
+        self.assertEqual((3, 3), labels.shape)
+        self.assertListEqual([3, 2, 1], list(K))
+        for i, threshold in enumerate(thresholds):
+            c_L = c.finish_co_occ_linkage(threshold, linkage='single')
+            self.assertListEqual(list(c_L.labels['co_occ_linkage']), list(labels[i]))
+            self.assertListEqual(list(labels[i]), list(cSweep.labels['co_occ_linkage_%d'%(i)]))
+            self.assertEqual(threshold, cSweep.params['co_occ_linkage_%d'%(i)]['threshold'])
+        cSweep, labels, K = c.finish_co_occ_linkage_sweep(n_clusters=[1, 2, 3])
+        self.assertListEqual([1, 2, 3], list(K))
+        self.assertRaises(ValueError, c.finish_co_occ_linkage_sweep)
+
+    def test_finish_co_occ_linkage_auto(self):
+        c = oe.cluster(self.data)
+        c.labels['a'] = np.array([0, 0, 1])
+        c.labels['b'] = np.array([0, 0, 1])
+        c.labels['c'] = np.array([0, 0, 0])
+        #merges at distances 0 and 2/3, cut in the middle of the gap
+        cAuto = c.finish_co_occ_linkage('auto', linkage='single')
+        self.assertAlmostEqual(1/3., cAuto.params['co_occ_linkage']['lifetime_threshold'])
+        self.assertListEqual([1, 1, 2], list(cAuto.labels['co_occ_linkage']))
+        self.assertEqual('auto', cAuto.params['co_occ_linkage']['threshold'])
+        self.assertRaises(ValueError, c.finish_co_occ_linkage, 'avg')
+
+    def test_majority_vote(self):
+        x = np.eye(6)
+        for i, j in [(0, 3), (4, 2), (2, 1)]:
+            x[i,j] = x[j,i] = 0.75
+        x[1,5] = x[5,1] = 0.5
+        mv = finish.majority_vote(pd.DataFrame(x), threshold=0.5)
+        self.assertListEqual([1, 2, 2, 1, 2, 3], list(mv.finish()))
+        self.assertEqual(3, mv.K)
+        self.assertListEqual([0, 1, 1, 0, 1, 5], list(finish.union_find(6, [0, 4, 2], [3, 2, 1])))
+
+    def test_majority_vote_signatures(self):
+        c = self.three_solutions()
+        for threshold in [0, 0.5, 0.7, 1]:
+            c_MV = c.finish_majority_vote(threshold=threshold)
+            c_sig = c.finish_majority_vote(threshold=threshold, signatures=True)
+            self.assertListEqual(list(c_MV.labels['majority_vote']), list(c_sig.labels['majority_vote']))
+        mv = finish.signature_majority_vote([[1, 1, 2, 1], [0, 0, 3, 0]], 4, threshold=0.5)
+        self.assertListEqual([1, 1, 2, 1], list(mv.finish()))
+        self.assertListEqual([0, 0, 1, 0], list(mv.groups))
+
+    def test_finish_mcla(self):
+        c = oe.cluster(self.data)
+        c.labels['a'] = np.array([0, 0, 1])
+        c.labels['b'] = np.array([5, 5, 2])
+        c.labels['c'] = np.array([1, 0, 1])
+        c_MCLA = c.finish_mcla(K=2)
+        self.assertListEqual([1, 1, 2], list(c_MCLA.labels['mcla']))
+        self.assertEqual(2, c_MCLA.params['mcla']['K'])
+        #the clusters {0,1} of a and b form one meta-cluster, the objects vote over the memberships
+        mc = finish.mcla([[0, 0, 1, 1], [1, 1, 0, 0], [0, 0, 0, 1]], 4, K=2)
+        self.assertListEqual([1, 1, 2, 2], list(mc.finish()))
+        self.assertEqual(2, mc.K)
+        self.assertListEqual([1, 2, 2, 1, 1, 2], list(mc.metaLabels))
+
+    def test_finish_alignment_vote(self):
+        c = oe.cluster(self.data)
+        c.labels['a'] = np.array([0, 0, 1])
+        c.labels['b'] = np.array([7, 7, 3])
+        c.labels['c'] = np.array([1, 0, 0])
+        c_AV = c.finish_alignment_vote()
+        self.assertListEqual([1, 1, 2], list(c_AV.labels['alignment_vote']))
+        self.assertRaises(ValueError, c.finish_alignment_vote, 'd')
+        #permuted labels are matched to the reference, the noisy object follows the plurality
+        parg = [[0, 0, 1, 1, 2, 2], [2, 2, 0, 0, 1, 1], [1, 1, 2, 2, 0, 2]]
+        av = finish.alignment_vote(parg, 6)
+        self.assertListEqual([1, 1, 2, 2, 3, 3], list(av.finish()))
+        self.assertEqual(3, av.K)
+        self.assertEqual(1, av.nIterations)
+        self.assertListEqual([0, 1, 2], list(av.votes[5][:3]))
+        #starting from the noisy solution, the second round aligns to the vote of the first
+        av = finish.alignment_vote(parg, 6, reference=2)
+        self.assertListEqual([1, 1, 2, 2, 3, 3], list(av.finish()))
+        self.assertEqual(2, av.nIterations)
+
+    def test_graph_closure(self):
+        x = np.eye(6)
+        for i, j in [(0, 1), (0, 2), (1, 2), (2, 3), (4, 5)]:
+            x[i,j] = x[j,i] = 0.75
+        gc = finish.graph_closure(pd.DataFrame(x), 0.5, clique_size=3)
+        self.assertEqual((5, 5), (len(gc.coMat_binary[0]), len(gc.coMat_binary[1])))
+        self.assertListEqual([0, 0, 0, 1, 2, 3], list(gc.finish()))
+        gc = finish.graph_closure(pd.DataFrame(x), 0.5, clique_size=2)
+        self.assertListEqual([0, 0, 0, 0, 1, 1], list(gc.finish()))
+        self.assertEqual(2, gc.K)
+        gc = finish.graph_closure(sps.csr_matrix(x), 0.8, clique_size=2)
+        self.assertListEqual([0, 1, 2, 3, 4, 5], list(gc.finish()))
+
+        #two triangles that share one object percolate only as 2-cliques. With the stream engine the one with the
+        #smallest member keeps the shared object, however many processes percolate
+        x = np.eye(5)
+        for i, j in [(2, 3), (2, 4), (3, 4), (0, 1), (0, 2), (1, 2)]:
+            x[i,j] = x[j,i] = 1
+        labels = finish.graph_closure(pd.DataFrame(x), 0.5, engine='clique_graph').finish()
+        self.assertEqual(2, len(set(labels)))
+        self.assertListEqual([0, 0, 0, 1, 1], list(finish.graph_closure(pd.DataFrame(x), 0.5, engine='stream').finish()))
+        self.assertListEqual([0, 0, 0, 1, 1], list(finish.graph_closure(pd.DataFrame(x), 0.5, engine='stream', n_jobs=2).finish()))
+        self.assertListEqual([0, 2, 0, 1], list(finish.label_communities([np.array([2, 3]), np.array([0, 2])], 4)))
+        self.assertRaises(ValueError, lambda: finish.graph_closure(pd.DataFrame(x), 0.5, engine='gobblygook'))
+
+    def test_finish_graph_closure_parallel(self):
+        rng = np.random.RandomState(3)
+        c = oe.cluster(self.data)
+        N = 18
+        c.dataObj = oe.data(pd.DataFrame(rng.randn(N, 3)), [0, 5, 30])
+        for h in range(10):
+            c.labels['random_%d'%(h)] = rng.randint(0, 3, size=N)
+        labels = c.finish_graph_closure(0.4, clique_size=3, engine='stream').labels['graph_closure']
+        for n_jobs, percolation_jobs in [(2, 1), (1, 2), (2, 2)]:
+            cG = c.finish_graph_closure(0.4, clique_size=3, n_jobs=n_jobs, engine='stream', percolation_jobs=percolation_jobs)
+            self.assertListEqual(list(labels), list(cG.labels['graph_closure']))
+
+    def test_finish_graph_closure_default(self):
+        #the default engine keeps the partitions of the original clique graph percolation, also for objects shared by
+        #overlapping percolated cliques
+        x = np.eye(5)
+        for i, j in [(2, 3), (2, 4), (3, 4), (0, 1), (0, 2), (1, 2)]:
+            x[i,j] = x[j,i] = 1
+        self.assertEqual('clique_graph', finish.graph_closure(pd.DataFrame(x), 0.5).engine)
+        self.assertListEqual(list(finish.graph_closure(pd.DataFrame(x), 0.5, engine='clique_graph').finish()), 
+            list(finish.graph_closure(pd.DataFrame(x), 0.5).finish()))
+
+        rng = np.random.RandomState(5)
+        c = oe.cluster(self.data)
+        N = 18
+        c.dataObj = oe.data(pd.DataFrame(rng.randn(N, 3)), [0, 5, 30])
+        for h in range(10):
+            c.labels['random_%d'%(h)] = rng.randint(0, 3, size=N)
+        cG = c.finish_graph_closure(0.4, clique_size=2)
+        baseline = finish.graph_closure(c.co_occurrence_matrix(), 0.4, clique_size=2, engine='clique_graph').finish()
+        self.assertListEqual(list(baseline), list(cG.labels['graph_closure']))
+        self.assertEqual('clique_graph', cG.params['graph_closure']['engine'])
+
+    def test_mixture_model(self):
+        parg = [np.array([0, 0, 0, 1, 1, 1]), np.array([2, 2, 2, 5, 5, 5]), np.array([0, 0, 1, 1, 1, 1])]
+        np.random.seed(0)
+        mm = finish.mixture_model(parg, 6, nEnsCluster=2, iterations=10)
+        labels = mm.emProcess()
+        self.assertEqual(1, len(set(labels[:3])))
+        self.assertEqual(1, len(set(labels[3:])))
+        self.assertNotEqual(labels[0], labels[3])
+        self.assertTrue(np.allclose(1, mm.ExpZ.sum(axis=1)))
+
+        #the posterior is the normalized product of v over the labels of each object
+        mm.expectation()
+        joint = np.array([[mm.alpha[m]*np.prod([mm.v[j][m][list(mm.K[j]).index(parg[j][i])] for j in range(3)])
+            for m in range(2)] for i in range(6)])
+        self.assertTrue(np.allclose(joint/joint.sum(axis=1)[:,None], mm.ExpZ))
+        self.assertAlmostEqual(np.log(joint.sum(axis=1)).sum(), mm.logLikelihood)
+
+    def test_mixture_model_restarts(self):
+        parg = [np.array([0, 0, 0, 1, 1, 1]), np.array([2, 2, 2, 5, 5, 5]), np.array([0, 0, 1, 1, 1, 1])]
+        mm = finish.mixture_model(parg, 6, nEnsCluster=2, iterations=100, tol=1e-8)
+        mm.emProcess()
+        self.assertTrue(mm.converged)
+        self.assertLess(mm.nIterations, 100)
+
+        mm = finish.mixture_model(parg, 6, nEnsCluster=2, iterations=20, n_init=3, random_state=0)
+        labels = mm.emProcess()
+        self.assertEqual(3, len(mm.logLikelihoods))
+        self.assertEqual(max(mm.logLikelihoods), mm.logLikelihood)
+        mm_parallel = finish.mixture_model(parg, 6, nEnsCluster=2, iterations=20, n_init=3, random_state=0, n_jobs=2)
+        self.assertListEqual(list(labels), list(mm_parallel.emProcess()))
+        self.assertListEqual(mm.logLikelihoods, mm_parallel.logLikelihoods)
+
+    def test_mixture_model_batches(self):
+        parg = [np.array([0, 0, 0, 1, 1, 1]), np.array([2, 2, 2, 5, 5, 5]), np.array([0, 0, 1, 1, 1, 1])]
+        mm = finish.mixture_model(parg, 6, nEnsCluster=2, iterations=10, random_state=0, batch_size=2)
+        labels = mm.emProcess()
+        self.assertEqual(30, mm.nSteps)
+        self.assertEqual(6, len(labels))
+        self.assertTrue(np.allclose(1, mm.ExpZ.sum(axis=1)))
+        self.assertAlmostEqual(1, mm.alpha.sum())
+        self.assertTrue(all(np.isclose(1, v_jm.sum()) for v_j in mm.v for v_jm in v_j))
+
+        #a single batch of all objects takes the same first step as full EM
+        mm = finish.mixture_model(parg, 6, nEnsCluster=2, iterations=1, random_state=0, batch_size=6)
+        mm_full = finish.mixture_model(parg, 6, nEnsCluster=2, iterations=1, random_state=0)
+        mm.emProcess()
+        mm_full.emProcess()
+        self.assertTrue(np.allclose(mm_full.alpha, mm.alpha))
+
+        for kwargs in [{'batch_size':0}, {'batch_size':2, 'step_decay':0.5}, {'batch_size':2, 'step_decay':1.5}]:
+            self.assertRaises(ValueError, finish.mixture_model, parg, 6, **kwargs)
+
+    def test_mixture_model_padded(self):
+        parg = [np.array([0, 0, 0, 1, 1, 1]), np.array([2, 2, 7, 5, 5, 5]), np.array([0., 0., np.nan, 1., 1., 1.])]
+        mm = finish.mixture_model(parg, 6, nEnsCluster=2, iterations=5, random_state=0)
+        mm.emProcess()
+        self.assertEqual((3, 2, 3), mm.V.shape)
+        self.assertEqual([(0, 1), (2, 5, 7), (0., 1.)], mm.K)
+        self.assertEqual([2, 3, 2], list(mm.mask.sum(axis=1)))
+        self.assertTrue(np.all(mm.V[~mm.mask[:,None,:].repeat(2, axis=1)] == 0))
+        #the missing label is coded -1 and left out of v
+        self.assertEqual(-1, mm.codes[2, 2])
+        self.assertTrue(all(np.isclose(1, v_jm.sum()) for v_j in mm.v for v_jm in v_j))
+
+    def test_co_occurrence_cache(self):
+        c = oe.cluster(self.data)
+        c.labels['a'] = np.array([0, 0, 1])
+        c.labels['b'] = np.array([1, 0, 0])
+        coMat = c.co_occurrence_matrix()
+        self.assertIs(coMat, c.co_occurrence_matrix())
+        self.assertIsNot(coMat, c.co_occurrence_matrix(sparse=True))
+        self.assertIsNot(coMat, c.co_occurrence_matrix(use_cache=False))
+
+        #changing the ensemble or its labels misses the cache
+        c.labels['b'] = np.array([1, 1, 0])
+        self.assertIsNot(coMat, c.co_occurrence_matrix())
+        self.assertEqual(3, len(c.co_cache))
+        c.clear_co_occurrence_cache()
+        self.assertEqual(0, len(c.co_cache))
+
+        #the least recently used matrices are evicted beyond the memory cap
+        c = oe.cluster(self.data, co_cache_bytes=2*coMat.nbytes)
+        c.labels['a'] = np.array([0, 0, 1])
+        coMat = c.co_occurrence_matrix()
+        c.labels['b'] = np.array([1, 0, 0])
+        c.co_occurrence_matrix()
+        c.labels['c'] = np.array([0, 0, 2])
+        c.co_occurrence_matrix()
+        self.assertEqual(2, len(c.co_cache))
+        del c.labels['b'], c.labels['c']
+        self.assertIsNot(coMat, c.co_occurrence_matrix())
+
+        #a matrix that grows after it is cached, by reading its co_matrix, is measured at its current size
+        c = oe.cluster(self.data, co_cache_bytes=3*coMat.counts.nbytes)
+        c.labels['a'] = np.array([0, 0, 1])
+        coMat = c.co_occurrence_matrix()
+        self.assertEqual(coMat.counts.nbytes, c.co_cache.nbytes)
+        coMat.co_matrix
+        self.assertEqual(coMat.nbytes, c.co_cache.nbytes)
+        c.labels['b'] = np.array([1, 0, 0])
+        c.co_occurrence_matrix()
+        self.assertLessEqual(c.co_cache.nbytes, c.co_cache.max_bytes)
+        self.assertEqual(1, len(c.co_cache))
+
+    def test_cluster_unpickle_legacy(self):
+        c = oe.cluster(self.data)
+        c.cluster('parent', 'kmeans', 'kmeans_0', K=2)
+        c.cluster('parent', 'kmeans', 'kmeans_1', K=2)
+        #cluster objects pickled before incremental counts and the co-occurrence cache lack their attributes
+        for attribute in ['incremental', 'co_counts', 'co_solutions', 'co_cache']:
+            delattr(c, attribute)
+        cOld = pickle.loads(pickle.dumps(c))
+        self.assertFalse(cOld.incremental)
+        self.assertEqual(2, cOld.co_occurrence_matrix().counts[0,0])
+        cOld.cluster('parent', 'kmeans', 'kmeans_2', K=2)
+        self.assertEqual(2, len(cOld.slice(['kmeans_0', 'kmeans_2']).labels))
+        self.assertEqual(3, len(cOld.finish_majority_vote(threshold=0.5).labels['majority_vote']))
+
     def test_cluster_search_field(self):
         self.data.transform('parent', 'zscore', 'zscore', axis=0)
         c = oe.cluster(self.data)